@@ -2,42 +2,51 @@
 This program is an implementation of the LSB steganographic method in the Python programming language using the PyQt5 GUI
 github: https://github.com/Polusummator/Stego
 
-TODO: design WAITING, change threading
+Jobs are added to a queue and run in parallel on a pool of worker threads (see jobs.py and tasks.py),
+the pictures of finished jobs are shown on the tab "Preview" (see preview.py)
+
+Run with --startup-time to print the time to the first window and exit
+The timings of the stages of every job are written to the log as JSON lines (see metrics.py)
 """
-import hashlib
+import base64
+import logging
 import os
-import random
-import shutil
 import sys
-import tempfile
-import threading
-import requests
+import time
+
+START_TIME = time.perf_counter()
 
-from PIL import Image
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
-from cryptography.fernet import Fernet
-from pathlib import Path
 
+import jobs
+import progress
+import resources
+
+# PIL, NumPy and cryptography are imported when the first container is chosen or the first job starts (see load_modules)
+engine = None
+tasks = None
+preview = None
 
-def thread(my_func):
+
+def load_modules():
     """
-    Starting function in the separate thread
+    Importing the modules that are needed only by the algorithm
     """
-    def wrapper(*args, **kwargs):
-        my_thread = threading.Thread(target=my_func, args=args, kwargs=kwargs)
-        my_thread.start()
-    return wrapper
+    global engine, tasks, preview
+    if tasks is None:
+        import engine
+        import preview
+        import tasks
 
 
 class Steganography(QMainWindow):
     """
     The main class of application
     """
-    my_signal1 = pyqtSignal(list, name='my_signal1')  # stego
-    my_signal2 = pyqtSignal(str, name='my_signal2')   # unstego
-    my_signal3 = pyqtSignal(list, name='my_signal3')  # PRNG
+    my_signal1 = pyqtSignal(object, name='my_signal1')  # finished job (tasks.Task)
+    my_signal2 = pyqtSignal(dict, name='my_signal2')  # metrics (timings of the stages of a finished job)
 
     def __init__(self):
         """
@@ -46,8 +55,17 @@ class Steganography(QMainWindow):
         super().__init__()
         self.showImage = False
         self.showBits = False
+        self.showPlanes = False
         self.showPixE = False
         self.showPixD = False
+        self.densityE = False
+        self.densityD = False
+        self.tasks = []  # jobs of the queue in the order of the queue panel
+        self.last = {}   # kind of job -> last added job (progress bar of its tab)
+        self.runner = jobs.Runner(QThread.idealThreadCount())
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(progress.INTERVAL)
+        self.progress_timer.timeout.connect(self.showProgress)
         self.initUI()
 
     def center(self):
@@ -69,15 +87,9 @@ class Steganography(QMainWindow):
 
         # ------------------------Icon-----------------------------
 
-        img = r'https://images.squarespace-cdn.com/content/v1/5981e865f14aa16941337125/1507228368642-3M1N4Z4KO42PGDZTMMWH/ke17ZwdGBToddI8pDm48kGDpvalPb1SqHoCn1hwN0Y57gQa3H78H3Y0txjaiv_0fDoOvxcdMmMKkDsyUqMSsMWxHk725yiiHCCLfrh8O1z5QHyNOqBUUEtDDsRWrJLTmx-YtV7KdJhhcFMxgH7DNwVWsr4BytTuzU0mdZNjZkC7ehjA8nxqmKGxR1QtMJl5J/discover.png'
-        p = requests.get(img)
-        some_icon_path = r".\SoMe_ApPlIcAtIoN_IcOn.png"
-        out = open(some_icon_path, 'wb')
-        out.write(p.content)
-        self.setWindowIcon(QIcon(some_icon_path))
-        out.close()
-        if os.path.isfile(some_icon_path):
-            os.remove(some_icon_path)
+        icon = QPixmap()
+        icon.loadFromData(base64.b64decode(resources.ICON), 'PNG')
+        self.setWindowIcon(QIcon(icon))
 
         self.tabwidget = TabWidget(self)
         self.setCentralWidget(self.tabwidget)
@@ -86,34 +98,8 @@ class Steganography(QMainWindow):
 
         self.bind()
 
-        self.createWait()
-
         self.show()
 
-    def createWait(self):
-        """
-        Creating wait-widget
-        """
-        self.lab = QLabel('Waiting', self)
-        self.lab.setStyleSheet("""
-                               font: Arial;
-                               font-size: 25px;
-                               color: grey;
-                               """)
-        self.lab.adjustSize()
-        self.H()
-
-        self.lab.move(self.rect().center() - QRect(QPoint(), self.lab.sizeHint()).center())
-
-    def H(self):
-        """
-        Hide/show label "Waiting"
-        """
-        if self.lab.isHidden():
-            self.lab.show()
-        else:
-            self.lab.hide()
-
     def bind(self):
         """
         Creating button functions
@@ -135,44 +121,62 @@ class Steganography(QMainWindow):
 
         self.tabwidget.tab1.groupbox2.check1.stateChanged.connect(self.checkbox1)
         self.tabwidget.tab1.groupbox2.check2.stateChanged.connect(self.checkbox2)
+        self.tabwidget.tab1.groupbox2.check4.stateChanged.connect(self.checkbox4)
         self.tabwidget.tab1.groupbox2.check3.stateChanged.connect(self.checkbox3E)
         self.tabwidget.tab2.groupCheck.check.stateChanged.connect(self.checkbox3D)
+        self.tabwidget.tab1.groupbox2.check5.stateChanged.connect(self.checkbox5E)
+        self.tabwidget.tab2.groupCheck.density.stateChanged.connect(self.checkbox5D)
+
+        # ----------------------Capacity---------------------------
+
+        self.tabwidget.tab1.groupbox1.edit1.textChanged.connect(self.showCapacity)
+        self.tabwidget.tab1.groupbox1.edit2.textChanged.connect(self.showCapacity)
+        self.tabwidget.tab1.groupbox2.codec.currentIndexChanged.connect(self.showCapacity)
+        self.tabwidget.tab1.groupbox2.depth.valueChanged.connect(self.showCapacity)
+
+        # -----------------------Queue-----------------------------
+
+        self.tabwidget.tab3.cancel.clicked.connect(self.cancelJobs)
+        self.tabwidget.tab3.clear.clicked.connect(self.clearJobs)
+
+        # ----------------------Preview----------------------------
+
+        self.tabwidget.tab4.pictures.currentIndexChanged.connect(self.tabwidget.tab4.fit)
+        self.tabwidget.tab4.zoomIn.clicked.connect(lambda: self.tabwidget.tab4.zoom(2))
+        self.tabwidget.tab4.zoomOut.clicked.connect(lambda: self.tabwidget.tab4.zoom(0.5))
+        self.tabwidget.tab4.zoomFit.clicked.connect(self.tabwidget.tab4.fit)
+        self.tabwidget.tab4.closePicture.clicked.connect(self.tabwidget.tab4.remove)
 
         # ------------------------Signals--------------------------
 
         self.my_signal1.connect(self.mySignalHandler1, Qt.QueuedConnection)
-        self.my_signal2.connect(self.mySignalHandler2, Qt.QueuedConnection)
-        self.my_signal3.connect(self.mySignalHandler3, Qt.QueuedConnection)
+        self.my_signal2.connect(self.showTimings)
 
-    def mySignalHandler1(self, img):
+    def mySignalHandler1(self, task):
         """
-        Receives a signal from the function stego and launches the function start_e_continue
-        :param img: [image] or ['error']
+        Receives a signal from a finished job, shows its state and sends its timings with my_signal2 (see showTimings)
+        :param task: tasks.Task
         """
-        if img == ['error']:
-            self.error()
-        else:
-            self.start_e_continue(img[0])
+        if task.record is None:
+            # the job was cancelled before it started
+            task.finish(tasks.CANCELLED)
+        self.showProgress()
+        if task.previews:
+            self.tabwidget.tabs.setCurrentWidget(self.tabwidget.tab4)
+            self.tabwidget.tab4.add(task.name(), task.previews)
+            task.previews = []
+        self.my_signal2.emit(task.record)
+        if task.status == tasks.FAILED:
+            QMessageBox.warning(self, 'Error', 'An error occurred ({}). Check that the files you entered are correct.\n\n{}'.format(task.name(), task.error))
 
-    def mySignalHandler2(self, txt):
+    def showTimings(self, record):
         """
-        Receives a signal from the function unstego and launches the function start_d_continue
-        :param txt: text or 'error'
+        Showing the timings of the stages of a finished job in the tooltip of its row of the queue (receives my_signal2)
+        :param record: metrics record of the job (see metrics.StageTimer.record)
         """
-        if txt == 'error':
-            self.error()
-        else:
-            self.start_d_continue(txt)
-
-    def mySignalHandler3(self, prng):
-        """
-        Receives a signal from the function PRNG and launches the function main_continue
-        :param prng: list of pseudo-random numbers or ['error']
-        """
-        if prng == ['error']:
-            self.error()
-        else:
-            self.main_continue(prng)
+        for row, task in enumerate(self.tasks):
+            if task.record is record:
+                self.tabwidget.tab3.setTimings(row, record)
 
     def checkbox1(self, state):
         """
@@ -194,6 +198,16 @@ class Steganography(QMainWindow):
         else:
             self.showBits = False
 
+    def checkbox4(self, state):
+        """
+        Processing a check4 (self.tabwidget.tab1.groupbox2.check4) change
+        :param state: the state of checkbox
+        """
+        if state == Qt.Checked:
+            self.showPlanes = True
+        else:
+            self.showPlanes = False
+
     def checkbox3E(self, state):
         """
         Processing a check2 (self.tabwidget.tab1.groupbox2.check3) change
@@ -214,464 +228,146 @@ class Steganography(QMainWindow):
         else:
             self.showPixD = False
 
-    def ProgressE(self, num):
+    def checkbox5E(self, state):
         """
-        Changing the progress bar value (encryption)
-        :param num: number of pixel
+        Processing a check5 (self.tabwidget.tab1.groupbox2.check5) change
+        :param state: the state of checkbox
         """
-        if num >= self.len_prng - 1:
-            self.tabwidget.tab1.pbar.setValue(100)
-            return
-        if not num:
-            self.tabwidget.tab1.pbar.setValue(0)
-            return
-
-        if int(num // (self.len_prng / 100)) > self.tabwidget.tab1.pbar.value():
-            self.tabwidget.tab1.pbar.setValue(min(100, int(num // (self.len_prng / 100))))
+        if state == Qt.Checked:
+            self.densityE = True
+        else:
+            self.densityE = False
 
-    def ProgressD(self, num):
+    def checkbox5D(self, state):
         """
-        Changing the progress bar value (decrypting)
-        :param num: number of number in the list of pseudo-random numbers
+        Processing a density (self.tabwidget.tab2.groupCheck.density) change
+        :param state: the state of checkbox
         """
-        if num >= self.len_prng - 1:
-            self.tabwidget.tab2.pbar.setValue(100)
+        if state == Qt.Checked:
+            self.densityD = True
+        else:
+            self.densityD = False
+
+    def showProgress(self):
+        """
+        Changing the progress bars of the jobs (called by self.progress_timer on the GUI thread,
+        the worker threads only add processed pixels to the progress of their jobs)
+        """
+        for row, task in enumerate(self.tasks):
+            self.tabwidget.tab3.setRow(row, task)
+        if 'embed' in self.last:
+            self.tabwidget.tab1.pbar.setValue(self.last['embed'].percent())
+        if 'extract' in self.last:
+            self.tabwidget.tab2.pbar.setValue(self.last['extract'].percent())
+        active = sum(task.active() for task in self.tasks)
+        self.tabwidget.tabs.setTabText(2, 'Queue ({})'.format(active) if active else 'Queue')
+        if not active:
+            self.progress_timer.stop()
+
+    def showCapacity(self):
+        """
+        Showing the maximum size of a message in the chosen container (only the header of the image is read)
+        """
+        tab1 = self.tabwidget.tab1
+        container = tab1.groupbox1.edit1.text()
+        message = tab1.groupbox1.edit2.text()
+        tab1.capacity.setStyleSheet('')
+        if not os.path.isfile(container):
+            tab1.capacity.setText('Maximum message size: -')
             return
-        if not num:
-            self.tabwidget.tab2.pbar.setValue(0)
+        load_modules()
+        try:
+            available = engine.image_capacity(container, tab1.groupbox2.depth.value())
+        except (OSError, ValueError):
+            tab1.capacity.setText('Maximum message size: - (the container is not an image)')
             return
+        text = 'Maximum message size: {:,} bytes'.format(available)
+        if os.path.isfile(message):
+            length = os.path.getsize(message)
+            text += ', message: {:,} bytes'.format(length)
+            if length > available:
+                compressed = tab1.groupbox2.compression()[0] is not None
+                text += ' (too large{})'.format(', can fit after compression' if compressed else '')
+                tab1.capacity.setStyleSheet('color: red')
+        tab1.capacity.setText(text)
 
-        if int(num // (self.len_prng / 100)) > self.tabwidget.tab2.pbar.value():
-            self.tabwidget.tab2.pbar.setValue(min(100, int(num // (self.len_prng / 100))))
-
-    @thread
-    def stego(self, width, height, image, prng, text, signal):
+    def addJob(self, task):
         """
-        Function for embedding a message in an image
-        :param width: picture width
-        :param height: picture height
-        :param image: image-container
-        :param prng: list of pseudo-random pixels
-        :param text: message (list of bits)
-        :return: filled container
+        Adding a job to the queue and starting it on the pool
+        :param task: tasks.Task
         """
-        try:
-            text_i = 0
-            self.H()
-            self.len_prng = len(prng)
-            for i in prng:
-                i1, j1 = (i + image.size[1] - 1) // image.size[1] - 1, (image.size[1] - 1, i % image.size[1])[bool(i % image.size[1])]
-                pixel = image.getpixel((i1, j1))
-                R, G, B = pixel
-                cur = text[text_i]
-                if len(cur) == 6:
-                    R, G, B = cur[:2], cur[2:4], cur[4:]
-                    r = self.change_bits(self.change_bits(pixel[0], 1, int(R[0])), 0, int(R[1]))
-                    g = self.change_bits(self.change_bits(pixel[1], 1, int(G[0])), 0, int(G[1]))
-                    b = self.change_bits(self.change_bits(pixel[2], 1, int(B[0])), 0, int(B[1]))
-                    image.putpixel((i1, j1), (r, g, b))
-                elif len(cur) == 4:
-                    R, G = cur[:2], cur[2:]
-                    r = self.change_bits(self.change_bits(pixel[0], 1, int(R[0])), 0, int(R[1]))
-                    g = self.change_bits(self.change_bits(pixel[1], 1, int(G[0])), 0, int(G[1]))
-                    image.putpixel((i1, j1), (r, g, pixel[2]))
-                elif len(cur) == 2:
-                    R = cur
-                    r = self.change_bits(self.change_bits(pixel[0], 1, int(R[0])), 0, int(R[1]))
-                    image.putpixel((i1, j1), (r, pixel[1], pixel[2]))
-                self.ProgressE(text_i)
-                text_i += 1
-            signal.emit([image])
-            return None
-        except:
-            signal.emit(['error'])
-
-    @thread
-    def unstego(self, image, prng, signal):
-        """
-        Function for extracting a message from an image
-        :param image: filled container
-        :param prng: list of pseudo-random pixels
-        :return: message
-        """
-        try:
-            self.len_prng = len(prng)
-            self.H()
-            text = ''
-            prng_i = 0
-            for i in prng:
-                i1, j1 = (i + image.size[1] - 1) // image.size[1] - 1, (image.size[1] - 1, i % image.size[1])[bool(i % image.size[1])]
-                pixel = image.getpixel((i1, j1))
-                R, G, B = pixel
-                text += str(self.get_bit(R, 1)) + str(self.get_bit(R, 0)) + str(self.get_bit(G, 1)) + str(self.get_bit(G, 0)) + str(self.get_bit(B, 1)) + str(self.get_bit(B, 0))
-                self.ProgressD(prng_i)
-                prng_i += 1
-            text_group = self.group(text, 8)[0]
-            text_end = ''
-            for i in text_group:
-                text_end += chr(int(i, 2))
-            if not text_end[-1].isprintable():
-                signal.emit(text_end[:-1])
-            else:
-                signal.emit(text_end)
-            return None
-        except:
-            signal.emit('error')
-
-    def group(self, string, str_len):
-        """
-        Function for splitting a string into blocks of a certain length
-        :param string: string
-        :param str_len: length of one block
-        :return: list of blocks and presence of an incomplete block
-        """
-        l_group = []
-        isMod = bool(len(string) % str_len)
-        for i in range((len(string) + str_len - 1) // str_len):
-            if i * str_len + str_len < len(string):
-                l_group.append(string[i * str_len:i * str_len + str_len])
-            else:
-                l_group.append(string[i * str_len:len(string)])
-        return l_group, isMod
+        self.tasks.append(task)
+        self.last[task.kind] = task
+        self.tabwidget.tab3.add(task)
+        task.handle = self.runner.submit(task)
+        task.handle.add_done_callback(lambda job: self.my_signal1.emit(task))
+        self.showProgress()
+        self.progress_timer.start()
 
-    @thread
-    def PRNG(self, *args):
+    def cancelJobs(self):
         """
-        The generator of pseudo-random pixels
-        (random.shuffle([1...number of pixels]))
-        :param args: (width - picture width, height - picture height, number - number of pixels) or (img - filled container, ekey - key to retrieve the message)
-        :return: list of pseudo-random pixels
+        Cancelling the selected jobs of the queue (a running job stops at the next chunk)
         """
-        try:
-            if len(args) == 4:
-                width, height, number, signal = args
-                field = width * height
-                rand_seed = random.randint(1, 4000000)
-                just_1 = random.randint(1, 1024)
-                just_2 = hashlib.sha256(str(just_1).encode('utf-8')).hexdigest()
-                key = self.Encrypt(just_1, rand_seed, number, just_2)
-                self.publicKey = key[0]
-                self.privateKey = key[1]
-                z = True
-            else:
-                img, ekey, signal = args
-                width, height = img.size[0], img.size[1]
-                t, k = ekey.split()
-                key_l = self.Decrypt(t, k)
-                rand_seed, number = key_l
-                field = width * height
-                z = False
-            all_list = list(range(0, field - 1))
-            random.seed(rand_seed)
-            random.shuffle(all_list)
-            PRNG_list = all_list[:number]
-            self.prng = PRNG_list
-            if z:
-                signal.emit(['e'] + PRNG_list)
-            else:
-                signal.emit(['d'] + PRNG_list)
-            return None
-        except:
-            signal.emit(['error'])
-
-    def change_bits(self, num, index, to):
-        """
-        Changing one bit in a number
-        :param num: number
-        :param index: bit number
-        :param to: new value of the bit
-        :return: number
-        """
-        if not to:
-            return ~(1 << index) & num
-        return (1 << index) | num
-
-    def get_bit(self, num, index):
-        """
-        Getting the value of a number bit
-        :param num: number
-        :param index: bit number
-        :return: bit
-        """
-        return int(bool(num & (1 << index)))
-
-    def Encrypt(self, *args):
-        """
-        Creating a key
-        :param args: a1, a7 - parameters for the test, a2-a6 - parameters for generator
-        :return: encrypted key and key for decrypting
-        """
-        a1, a2, a3, a4, = args
-        s = '{} {} {} {}'.format(a1, a2, a3, a4)
-        c_key = Fernet.generate_key()
-        cipher = Fernet(c_key)
-        txt = bytes(s, 'utf-8')
-        e_txt = cipher.encrypt(txt)
-        return e_txt.decode('utf-8'), c_key.decode('utf-8')
-
-    def Decrypt(self, *args):
-        """
-        Decrypting the key
-        :param args: e_txt - encrypted key, c_key - key for decrypting
-        :return: parameters for generator
-        """
-        e_txt, c_key = args
-        e_txt = bytes(e_txt, 'utf-8')
-        c_key = bytes(c_key, 'utf-8')
-        cipher = Fernet(c_key)
-        d_txt = cipher.decrypt(e_txt)
-        txt = d_txt.decode('utf-8')
-        txt_list = txt.split()
-        z = True
-        if len(txt_list) == 4:
-            for i in range(3):
-                if not txt_list[i].isdigit():
-                    z = False
-                    break
-            if z:
-                test_hash = hashlib.sha256(txt_list[0].encode('utf-8')).hexdigest()
-                z = (False, True)[test_hash == txt_list[3]]
-        else:
-            z = False
-        if z:
-            txt_list = list(map(int, txt_list[1:3]))
-            return txt_list
-
-    def to_textb(self, text):
-        """
-        Converting text to binary and dividing it into blocks
-        :param text: message
-        :return: list of blocks in binary format
-        """
-        text_b = ''
-        for i in text:
-            text_b += bin(ord(i))[2:].rjust(8, '0')
-        Group, isMod = self.group(text_b, 6)
-        return Group
-
-    @thread
-    def show_rgb(self, img):
-        """
-        Demonstration of least significant bits of pixels
-        :param img: image
-        """
-        self.inactive(False)
-        self.H()
-        w, h = img.size[0], img.size[1]
-        for i in range(w):
-            for j in range(h):
-                pixel = img.getpixel((i, j))
-                R, G, B = pixel
-                color = [R, G, B]
-                new_color = [0, 0, 0]
-                for col_i in range(3):
-                    col = color[col_i]
-                    if self.get_bit(col, 1) and self.get_bit(col, 0):
-                        new_color[col_i] = 255
-                    if self.get_bit(col, 1) and not self.get_bit(col, 0):
-                        new_color[col_i] = 170
-                    if not self.get_bit(col, 1) and self.get_bit(col, 0):
-                        new_color[col_i] = 85
-                    if not self.get_bit(col, 1) and not self.get_bit(col, 0):
-                        new_color[col_i] = 0
-                img.putpixel((i, j), (new_color[0], new_color[1], new_color[2]))
-        img.show()
-        if self.showPixE:
-            self.show_pix('e')
-        else:
-            self.closeContainer()
-            self.H()
-            self.inactive(True)
-
-    @thread
-    def show_pix(self, mode):
-        """
-        Show the pixel distribution
-        :param mode: 'e' (encryption) or 'd' (decryption)
-        """
-        if (not self.showBits and mode == 'e') or mode == 'd':
-            self.H()
-        img = self.container
-        prng = self.prng
-        w, h = img.size[0], img.size[1]
-        used_pix = Image.new('RGB', (w, h), (255, 255, 255))
-        for i in prng:
-            i1, j1 = (i + h - 1) // h - 1, (h - 1, i % h)[bool(i % h)]
-            used_pix.putpixel((i1, j1), (0, 0, 0))
-        self.H()
-        self.closeContainer()
-        used_pix.show()
-        used_pix.close()
-        self.inactive(True)
-
-    def main(self, mode, a1, a2):
-        """
-        Starting the algorithm
-        :param mode: encrypt/decrypt ('e' or 'd')
-        :param a1: image-container
-        :param a2: text (mode 'e') or key (mode 'd')
-        :return: filled container (mode 'e') or message (mode 'd')
-        """
-        img = a1
-        self.H()
-        if mode == 'e':
-            self.mode = 'e'
-            data = img.size[0] * img.size[1]
-            self.size = data
-            text = a2
-            Group = self.to_textb(text)
-            self.image = img
-            self.Group = Group
-            self.PRNG(img.size[0], img.size[1], len(Group), self.my_signal3)
-        else:
-            self.mode = 'd'
-            key = a2
-            self.image = img
-            self.PRNG(img, key, self.my_signal3)
+        for row in self.tabwidget.tab3.selected():
+            task = self.tasks[row]
+            if task.active():
+                task.handle.cancel()
 
-    def main_continue(self, prng):
+    def clearJobs(self):
         """
-        Continuation of function main (starting the algorithm)
-        :param prng: list of pseudo-random numbers (the first element is 'e' or 'd')
+        Removing the finished jobs from the queue
         """
-        if prng[0] == 'e':
-            image = self.image
-            self.stego(image.size[1], image.size[0], image, prng[1:], self.Group, self.my_signal1)
-        else:
-            self.unstego(self.image, prng[1:], self.my_signal2)
-
-    def error(self):
-        """
-        Error notification
-        """
-        QMessageBox.warning(self, 'Error', 'An error occurred. Check that the files you entered are correct.')
-        if not self.lab.isHidden():
-            self.H()
-        if self.mode == 'e':
-            if self.copy:
-                self.container.close()
-                lol = self.copyPath
-                os.remove(self.copyPath)
-                self.copy = False
-        self.inactive(True)
-        self.tabwidget.tab1.pbar.setValue(0)
-        self.tabwidget.tab2.pbar.setValue(0)
+        for row in reversed(range(len(self.tasks))):
+            if not self.tasks[row].active():
+                self.tabwidget.tab3.table.removeRow(row)
+                del self.tasks[row]
 
     def Start_e(self):
         """
-        Checking the correctness of the entered data and running the algorithm of encryption
+        Checking the correctness of the entered data and adding a job of encryption to the queue
         """
+        load_modules()
         edit1 = self.tabwidget.tab1.groupbox1.edit1.text()
         edit2 = self.tabwidget.tab1.groupbox1.edit2.text()
         edit3 = self.tabwidget.tab1.groupbox3.edit1.text()
         if os.path.isfile(edit1) and os.path.isfile(edit2) and os.path.isdir(edit3):
-            correct1 = edit1[-4:] in ['.png', 'jpeg', '.bmp', '.jpg']
-            correct2 = edit2[-3:] == 'txt'
-            if correct1 and correct2:
-                copy = False
-                if edit1[-3:] != 'bmp':
-                    copy = True
-                    copyPath, fileName = self.convertFile(edit1)
-                    self.fileName = fileName
-                    self.copyPath = copyPath
-                    container = Image.open(copyPath)
-                else:
-                    container = Image.open(edit1)
-                message = open(edit2).read()
-                message = message.encode('ascii', 'ignore').decode('ascii')
-                self.inactive(False)
-                self.copy = copy
-                self.container = container
-                self.edit3 = edit3
-                self.edit1 = edit1
-                self.main('e', container, message)
+            # the message can be any file (text or binary)
+            if edit1[-4:] in ['.png', 'jpeg', '.bmp', '.jpg', '.tif', 'tiff']:
+                codec, level = self.tabwidget.tab1.groupbox2.compression()
+                depth = self.tabwidget.tab1.groupbox2.depth.value()
+                try:
+                    engine.preflight(edit1, edit2, depth, codec)
+                except (OSError, ValueError) as e:
+                    QMessageBox.warning(self, 'Error', str(e))
+                    return
+                self.addJob(tasks.EmbedTask(edit1, edit2, edit3, self.showImage, self.showBits, self.showPixE, codec, level, depth,
+                                            self.showPlanes, self.densityE))
             else:
                 QMessageBox.warning(self, 'Error', 'The file is not in the correct format')
         else:
             QMessageBox.warning(self, 'Error', 'File or directory not found')
 
-    def start_e_continue(self, image_stego):
-        """
-        Continuation of function Start_e (writing the results to files)
-        :param image_stego: filled container
-        """
-        self.inactive(True)
-        save = self.edit3
-        pathSaveDir = save + '/Steganography'
-        if not os.path.isdir(pathSaveDir):
-            os.mkdir(pathSaveDir)
-        if not self.copy:
-            self.fileName = self.file_name(self.edit1)
-        image_stego.save(pathSaveDir + '/' + self.fileName)
-        if self.showImage:
-            image_stego.show()
-        if self.copy:
-            self.copy = False
-            os.remove(self.copyPath)
-        public_file = open(pathSaveDir + '/PublicKey.txt', 'w')
-        private_file = open(pathSaveDir + '/PrivateKey.txt', 'w')
-        public_file.write(self.publicKey)
-        private_file.write(self.privateKey)
-        public_file.close()
-        private_file.close()
-        if self.showBits:
-            self.show_rgb(image_stego)
-        elif self.showPixE:
-            self.show_pix('e')
-        else:
-            self.container.close()
-
-    def closeContainer(self):
-        """
-        Closing the image-file
-        """
-        self.container.close()
-
     def Start_d(self):
         """
-        Checking the correctness of the entered data and running the algorithm of decryption
+        Checking the correctness of the entered data and adding a job of decryption to the queue
         """
+        load_modules()
         edit1 = self.tabwidget.tab2.groupbox1.edit1.text()
         edit2 = self.tabwidget.tab2.groupbox2.edit1.text()
         edit3 = self.tabwidget.tab2.groupbox2.edit2.text()
         edit4 = self.tabwidget.tab2.groupbox3.edit1.text()
         if os.path.isfile(edit1) and os.path.isfile(edit2) and os.path.isfile(edit3) and os.path.isdir(edit4):
-            correct1 = edit1[-3:] == 'bmp'
+            # RGB containers are saved as BMP, the other modes as PNG (see engine.container_suffix)
+            correct1 = edit1[-3:] in ['bmp', 'png']
             correct2 = edit2[-3:] == 'txt'
             correct3 = edit3[-3:] == 'txt'
             if correct1 and correct2 and correct3:
-                container = Image.open(edit1)
-                pub_key = open(edit2).read()
-                pri_key = open(edit3).read()
-                self.edit4 = edit4
-                self.container = container
-                self.inactive(False)
-                self.main('d', container, pub_key.strip() + ' ' + pri_key.strip())
+                self.addJob(tasks.ExtractTask(edit1, edit2, edit3, edit4, self.showPixD, self.densityD))
             else:
                 QMessageBox.warning(self, 'Error', 'The file is not in the correct format')
         else:
             QMessageBox.warning(self, 'Error', 'File or directory not found')
 
-    def start_d_continue(self, message):
-        """
-        Continuation of function Start_d (writing the results to files)
-        :param message: message from container
-        """
-        self.inactive(True)
-        save = self.edit4
-        pathSaveDir = save + '/Steganography'
-        if not os.path.isdir(pathSaveDir):
-            os.mkdir(pathSaveDir)
-        fileName = '/StegoText.txt'
-        message_file = open(pathSaveDir + fileName, 'w', encoding='ascii')
-        message = message.encode('ascii', 'ignore').decode('ascii')
-        message_file.write(message)
-        message_file.close()
-        if self.showPixD:
-            self.show_pix('d')
-        else:
-            self.container.close()
-
     def getDirectory(self, btn):
         """
         Directory selection
@@ -689,13 +385,13 @@ class Steganography(QMainWindow):
         :param btn: button-object
         """
         if btn == self.tabwidget.tab1.groupbox1.but1:
-            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "All Files (*.bmp; *.png; *.jpeg; *.jpg);;BMP Files(*.bmp);;PNG Files(*.png);;JPEG Files(*.jpeg);;JPG Files(*.jpg)")[0]
+            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "All Files (*.bmp; *.png; *.jpeg; *.jpg; *.tif; *.tiff);;BMP Files(*.bmp);;PNG Files(*.png);;JPEG Files(*.jpeg);;JPG Files(*.jpg);;TIFF Files(*.tif; *.tiff)")[0]
             self.tabwidget.tab1.groupbox1.edit1.setText(filename)
         elif btn == self.tabwidget.tab2.groupbox1.but1:
-            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "BMP Files(*.bmp)")[0]
+            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "Containers (*.bmp; *.png);;BMP Files(*.bmp);;PNG Files(*.png)")[0]
             self.tabwidget.tab2.groupbox1.edit1.setText(filename)
         elif btn == self.tabwidget.tab1.groupbox1.but2:
-            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "Text Files (*.txt)")[0]
+            filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "All Files (*);;Text Files (*.txt)")[0]
             self.tabwidget.tab1.groupbox1.edit2.setText(filename)
         elif btn == self.tabwidget.tab2.groupbox2.but1:
             filename = QFileDialog.getOpenFileName(self, "Choose a file", ".", "Text Files (*.txt)")[0]
@@ -710,64 +406,15 @@ class Steganography(QMainWindow):
         """
         reply = QMessageBox.question(self, 'Quit', "Are you sure to quit?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
+            self.runner.shutdown()
             event.accept()
         else:
             event.ignore()
 
-    def convertFile(self, path):
-        """
-        Converting a file to the desired format
-        :param path: file path
-        :return: path to the modifies copy of the file, name of the file
-        """
-        temp_path, fileName = self.create_temporary_copy(path)
-        point_l = temp_path.split('.')
-        point_l.pop()
-        path_without = '.'.join(map(str, point_l))
-        new_path = path_without + '.bmp'
-        p = Path(temp_path)
-        p.rename(new_path)
-        fileName = fileName.split('.')[0] + '.bmp'
-        return new_path, fileName
-
-    def create_temporary_copy(self, path):
-        """
-        Creating temporary copy of the file
-        :param path: file path
-        :return: path to copy, name of the file
-        """
-        temp_dir = tempfile.gettempdir()
-        fileName = self.file_name(path)
-        temp_path = os.path.join(temp_dir, fileName)
-        shutil.copy2(path, temp_path)
-        return temp_path, fileName
-
-    def file_name(self, path):
-        """
-        Finding the file name from its path
-        :param path: file path
-        :return: file name
-        """
-        fileName = ''
-        for i in path[::-1]:
-            if i in ['/', '\\']:
-                break
-            else:
-                fileName += i
-        fileName = fileName[::-1]
-        return fileName
-
-    def inactive(self, mode):
-        """
-        Making widgets active/inactive
-        :param mode: True/False
-        """
-        self.tabwidget.inactive(mode)
-
 
 class TabWidget(QWidget):
     """
-    Creating a TabWidget with 2 tabs
+    Creating a TabWidget with 4 tabs
     """
     def __init__(self, parent):
         super(QWidget, self).__init__(parent)
@@ -776,9 +423,13 @@ class TabWidget(QWidget):
         self.tabs = QTabWidget()
         self.tab1 = QWidget()
         self.tab2 = QWidget()
+        self.tab3 = Queue(self)
+        self.tab4 = Preview(self)
 
         self.tabs.addTab(self.tab1, 'Encryption')
         self.tabs.addTab(self.tab2, 'Decryption')
+        self.tabs.addTab(self.tab3, 'Queue')
+        self.tabs.addTab(self.tab4, 'Preview')
 
         # ------------------------tab1-----------------------------
 
@@ -788,7 +439,10 @@ class TabWidget(QWidget):
         self.tab1.groupbox2 = Group2(self)
         self.tab1.groupbox3 = Group3(self)
 
+        self.tab1.capacity = QLabel('Maximum message size: -', self)
+
         self.tab1.layout.addWidget(self.tab1.groupbox1)
+        self.tab1.layout.addWidget(self.tab1.capacity)
         self.tab1.layout.addWidget(self.tab1.groupbox2)
         self.tab1.layout.addWidget(self.tab1.groupbox3)
 
@@ -838,7 +492,14 @@ class TabWidget(QWidget):
         self.tab2.groupCheck.setTitle('Options')
         self.tab2.groupCheck.hlayoutCheck = QHBoxLayout(self)
         self.tab2.groupCheck.check = QCheckBox('Show used pixels', self)
+        # heatmap of engine.used_density instead of the full-size map
+        self.tab2.groupCheck.density = QCheckBox('As density map', self)
+        self.tab2.groupCheck.density.setEnabled(False)
+        self.tab2.groupCheck.check.stateChanged.connect(
+            lambda state: self.tab2.groupCheck.density.setEnabled(state == Qt.Checked))
         self.tab2.groupCheck.hlayoutCheck.addWidget(self.tab2.groupCheck.check)
+        self.tab2.groupCheck.hlayoutCheck.addWidget(self.tab2.groupCheck.density)
+        self.tab2.groupCheck.hlayoutCheck.addStretch()
         self.tab2.groupCheck.setLayout(self.tab2.groupCheck.hlayoutCheck)
 
         self.tab2.hlayout.addWidget(self.tab2.pbar)
@@ -872,25 +533,6 @@ class TabWidget(QWidget):
         self.group2.addButton(self.tab1.groupbox3.but1)
         self.group2.addButton(self.tab2.groupbox3.but1)
 
-    def inactive(self, mode):
-
-        # --------------------GroupBoxes---------------------------
-
-        self.tab1.groupbox1.inactive(mode)
-        self.tab1.groupbox2.inactive(mode)
-        self.tab1.groupbox3.inactive(mode)
-        self.tab2.groupbox1.inactive(mode)
-        self.tab2.groupbox2.inactive(mode)
-        self.tab2.groupbox3.inactive(mode)
-
-        # ----------Tabs and widgets without groupboxes------------
-
-        self.tab1.dialog.setEnabled(mode)
-        self.tab2.dialog.setEnabled(mode)
-        self.tab2.groupCheck.check.setEnabled(mode)
-        self.tab1.setEnabled(mode)
-        self.tab2.setEnabled(mode)
-
 
 class Group1(QGroupBox):
     """
@@ -948,16 +590,6 @@ class Group1(QGroupBox):
 
         self.setLayout(self.layout)
 
-    def inactive(self, mode):
-        """
-        Making widgets active/inactive
-        :param mode: True/False
-        """
-        self.edit1.setEnabled(mode)
-        self.but1.setEnabled(mode)
-        self.edit2.setEnabled(mode)
-        self.but2.setEnabled(mode)
-
 
 class Group2(QGroupBox):
     """
@@ -971,23 +603,71 @@ class Group2(QGroupBox):
         self.check1 = QCheckBox('Show image', self)
         self.check2 = QCheckBox('Show least significant bits', self)
         self.check3 = QCheckBox('Show used pixels', self)
+        self.check4 = QCheckBox('One picture per channel', self)
+        self.check4.setEnabled(False)
+        self.check2.stateChanged.connect(lambda state: self.check4.setEnabled(state == Qt.Checked))
+        # heatmap of engine.used_density instead of the full-size map
+        self.check5 = QCheckBox('As density map', self)
+        self.check5.setEnabled(False)
+        self.check3.stateChanged.connect(lambda state: self.check5.setEnabled(state == Qt.Checked))
+
+        self.hlayout3 = QHBoxLayout()
+        self.hlayout3.addWidget(self.check2)
+        self.hlayout3.addWidget(self.check4)
+        self.hlayout3.addStretch()
+
+        self.hlayout4 = QHBoxLayout()
+        self.hlayout4.addWidget(self.check3)
+        self.hlayout4.addWidget(self.check5)
+        self.hlayout4.addStretch()
+
+        # codecs of engine.CODECS
+        self.lab1 = QLabel('Compression:', self)
+        self.codec = QComboBox(self)
+        self.codec.addItems(['None', 'zlib', 'lzma', 'bz2'])
+        self.lab2 = QLabel('Level:', self)
+        self.level = QSpinBox(self)
+        self.level.setRange(1, 9)
+        self.level.setValue(6)
+        self.level.setEnabled(False)
+        self.codec.currentIndexChanged.connect(lambda index: self.level.setEnabled(index > 0))
+
+        self.hlayout = QHBoxLayout()
+        self.hlayout.addWidget(self.lab1)
+        self.hlayout.addWidget(self.codec)
+        self.hlayout.addWidget(self.lab2)
+        self.hlayout.addWidget(self.level)
+        self.hlayout.addStretch()
+
+        # least significant bits of a channel holding the message (engine.DEPTHS, stored in the key)
+        self.lab3 = QLabel('Bits per channel:', self)
+        self.depth = QSpinBox(self)
+        self.depth.setRange(1, 4)
+        self.depth.setValue(2)
+
+        self.hlayout2 = QHBoxLayout()
+        self.hlayout2.addWidget(self.lab3)
+        self.hlayout2.addWidget(self.depth)
+        self.hlayout2.addStretch()
 
         self.layout.addWidget(self.check1)
-        self.layout.addWidget(self.check2)
-        self.layout.addWidget(self.check3)
+        self.layout.addLayout(self.hlayout3)
+        self.layout.addLayout(self.hlayout4)
+        self.layout.addLayout(self.hlayout)
+        self.layout.addLayout(self.hlayout2)
 
         self.setTitle('Options')
 
         self.setLayout(self.layout)
 
-    def inactive(self, mode):
+    def compression(self):
         """
-        Making widgets active/inactive
-        :param mode: True/False
+        Chosen compression of the message
+        :return: codec (None if the message is not compressed), level
         """
-        self.check1.setEnabled(mode)
-        self.check2.setEnabled(mode)
-        self.check3.setEnabled(mode)
+        if self.codec.currentIndex() == 0:
+            return None, None
+        return self.codec.currentText(), self.level.value()
 
 
 class Group3(QGroupBox):
@@ -1022,16 +702,202 @@ class Group3(QGroupBox):
 
         self.setLayout(self.layout)
 
-    def inactive(self, mode):
+
+class Queue(QWidget):
+    """
+    Creating a panel with the queue of jobs
+    """
+    def __init__(self, parent):
+        super(QWidget, self).__init__(parent)
+
+        self.layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, 4, self)
+        self.table.setHorizontalHeaderLabels(['Job', 'Container', 'Status', 'Progress'])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+
+        self.hlayout = QHBoxLayout()
+        self.cancel = QPushButton('Cancel selected')
+        self.clear = QPushButton('Clear finished')
+
+        self.hlayout.addStretch()
+        self.hlayout.addWidget(self.cancel)
+        self.hlayout.addWidget(self.clear)
+
+        self.layout.addWidget(self.table)
+        self.layout.addLayout(self.hlayout)
+
+        self.setLayout(self.layout)
+
+    def add(self, task):
+        """
+        Adding a row of a job
+        :param task: tasks.Task
+        """
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.table.setItem(row, 0, QTableWidgetItem(task.kind))
+        self.table.setItem(row, 1, QTableWidgetItem(task.name()))
+        self.table.item(row, 1).setToolTip(task.container)
+        self.table.setItem(row, 2, QTableWidgetItem(task.status))
+        self.table.setCellWidget(row, 3, QProgressBar())
+        self.setRow(row, task)
+
+    def setRow(self, row, task):
+        """
+        Changing the status and the progress of a job
+        :param row: row of the job
+        :param task: tasks.Task
+        """
+        self.table.item(row, 2).setText(task.describe())
+        self.table.item(row, 2).setToolTip(task.error or task.path or '')
+        self.table.cellWidget(row, 3).setValue(task.percent())
+
+    def setTimings(self, row, record):
+        """
+        Showing the timings of the stages of a finished job in the tooltip of its first column
+        :param row: row of the job
+        :param record: metrics record of the job (see metrics.StageTimer.record)
+        """
+        lines = ['{}: {:.3f} s'.format(stage, seconds) for stage, seconds in record['stages'].items()]
+        lines.append('total: {:.3f} s'.format(record['total']))
+        self.table.item(row, 0).setToolTip('\n'.join(lines))
+
+    def selected(self):
+        """
+        :return: selected rows
+        """
+        return sorted({index.row() for index in self.table.selectionModel().selectedRows()})
+
+
+class Preview(QWidget):
+    """
+    Creating a panel with the pictures of the finished jobs (preview.Pyramid, drawn at the zoom of the panel)
+    """
+    MAX_ZOOM = 8
+    MIN_SIDE = 64  # longest side of a drawn picture
+    MAX_SIDE = 8192
+
+    def __init__(self, parent):
+        super(QWidget, self).__init__(parent)
+
+        self.pyramids = []  # preview.Pyramid of every item of self.pictures
+        self.scale = 1
+
+        self.layout = QVBoxLayout(self)
+
+        self.pictures = QComboBox(self)
+        self.pictures.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLength)
+
+        self.view = QLabel(self)
+        self.view.setAlignment(Qt.AlignCenter)
+        self.area = QScrollArea(self)
+        self.area.setAlignment(Qt.AlignCenter)
+        self.area.setWidget(self.view)
+
+        self.hlayout = QHBoxLayout()
+        self.zoomOut = QPushButton('-')
+        self.zoomIn = QPushButton('+')
+        self.zoomFit = QPushButton('Fit')
+        self.label = QLabel(self)
+        self.closePicture = QPushButton('Close picture')
+
+        self.hlayout.addWidget(self.zoomOut)
+        self.hlayout.addWidget(self.zoomIn)
+        self.hlayout.addWidget(self.zoomFit)
+        self.hlayout.addWidget(self.label)
+        self.hlayout.addStretch()
+        self.hlayout.addWidget(self.closePicture)
+
+        self.layout.addWidget(self.pictures)
+        self.layout.addWidget(self.area)
+        self.layout.addLayout(self.hlayout)
+
+        self.setLayout(self.layout)
+
+    def add(self, name, pictures):
+        """
+        Adding the pictures of a job and showing the first of them
+        :param name: file name of the container of the job
+        :param pictures: list of (title, image)
+        """
+        index = len(self.pyramids)
+        for title, image in pictures:
+            self.pyramids.append(preview.Pyramid(image))
+            self.pictures.addItem('{}: {}'.format(name, title))
+        self.pictures.setCurrentIndex(index)
+
+    def remove(self):
+        """
+        Removing the current picture
+        """
+        index = self.pictures.currentIndex()
+        if index >= 0:
+            del self.pyramids[index]
+            self.pictures.removeItem(index)
+        if not self.pyramids:
+            self.draw()
+
+    def fit(self):
+        """
+        Showing the whole current picture (not enlarged)
+        """
+        if self.pictures.currentIndex() >= 0:
+            width, height = self.pyramids[self.pictures.currentIndex()].size()
+            viewport = self.area.viewport().size()
+            self.scale = min(1, (viewport.width() - 2) / width, (viewport.height() - 2) / height)
+        self.draw()
+
+    def zoom(self, factor):
+        """
+        Changing the zoom of the current picture
+        :param factor: 2 to zoom in, 0.5 to zoom out
         """
-        Making widgets active/inactive
-        :param mode: True/False
+        if self.pictures.currentIndex() < 0:
+            return
+        width, height = self.pyramids[self.pictures.currentIndex()].size()
+        self.scale = max(min(1, self.MIN_SIDE / max(width, height)), min(self.scale * factor, self.MAX_ZOOM, self.MAX_SIDE / max(width, height)))
+        self.draw()
+
+    def draw(self):
         """
-        self.edit1.setEnabled(mode)
-        self.but1.setEnabled(mode)
+        Drawing the current picture from the smallest level of its pyramid that is enough for the zoom
+        """
+        index = self.pictures.currentIndex()
+        if index < 0:
+            self.view.clear()
+            self.view.adjustSize()
+            self.label.clear()
+            return
+        pyramid = self.pyramids[index]
+        factor, image = pyramid.level(self.scale)
+        fmt = {'L': QImage.Format_Grayscale8, 'RGB': QImage.Format_RGB888, 'RGBA': QImage.Format_RGBA8888}[image.mode]
+        data = image.tobytes()
+        qimage = QImage(data, image.size[0], image.size[1], image.size[0] * len(image.getbands()), fmt)
+        width, height = pyramid.size()
+        size = QSize(max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        # enlarged pixels stay sharp, a level is at most twice the drawn size
+        mode = Qt.FastTransformation if self.scale * factor > 1 else Qt.SmoothTransformation
+        self.view.setPixmap(QPixmap.fromImage(qimage).scaled(size, Qt.IgnoreAspectRatio, mode))
+        self.view.adjustSize()
+        self.label.setText('{:.0f}%  {} x {}'.format(self.scale * 100, width, height))
+
+
+def startup_time():
+    """
+    Printing the time from the start of the program to the first window and closing the application
+    """
+    print('Time to first window: {:.0f} ms'.format((time.perf_counter() - START_TIME) * 1000))
+    QApplication.quit()
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     app = QApplication(sys.argv)
     stego = Steganography()
+    if '--startup-time' in sys.argv:
+        QTimer.singleShot(0, startup_time)
     sys.exit(app.exec_())
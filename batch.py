@@ -0,0 +1,278 @@
+"""
+Batch command line interface of the Steganography application
+Embedding or extraction runs over a directory or a manifest of carriers on a pool of processes
+
+    python batch.py embed CARRIERS OUT      CARRIERS: directory with images and <image name>.txt messages
+                                                      or manifest (.csv: carrier,payload)
+    python batch.py extract CONTAINERS OUT  CONTAINERS: output directory of embed
+                                                        or manifest (.csv: container,public_key,private_key)
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import engine
+import metrics
+
+IMAGES = ('.png', '.jpeg', '.bmp', '.jpg', '.tif', '.tiff')
+
+
+def available_cores():
+    """
+    Number of cores this process may run on
+    :return: number of cores
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def stem(path):
+    """
+    Name of the file without directory and extension
+    :param path: file path
+    :return: name
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_manifest(path, columns):
+    """
+    Reading a manifest (csv with a header), relative paths are taken from the manifest directory
+    :param path: manifest path
+    :param columns: names of required columns
+    :return: list of tuples of paths
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return [tuple(os.path.join(base, row[c].strip()) for c in columns) for row in rows]
+
+
+def embed_jobs(source):
+    """
+    Finding carriers and messages
+    :param source: directory or manifest
+    :return: list of (carrier, payload)
+    """
+    if os.path.isfile(source):
+        return read_manifest(source, ('carrier', 'payload'))
+    jobs = []
+    for name in sorted(os.listdir(source)):
+        if os.path.splitext(name)[1].lower() in IMAGES:
+            carrier = os.path.join(source, name)
+            jobs.append((carrier, os.path.join(source, stem(name) + '.txt')))
+    return jobs
+
+
+def extract_jobs(source):
+    """
+    Finding containers and keys
+    :param source: directory (output of embed) or manifest
+    :return: list of (container, public key, private key)
+    """
+    if os.path.isfile(source):
+        return read_manifest(source, ('container', 'public_key', 'private_key'))
+    jobs = []
+    for name in sorted(os.listdir(source)):
+        item = os.path.join(source, name)
+        # RGB containers are saved as BMP, the other modes as PNG (see engine.container_suffix)
+        for suffix in ('.bmp', '.png'):
+            container = os.path.join(item, name + suffix)
+            if os.path.isfile(container):
+                jobs.append((container, os.path.join(item, 'PublicKey.txt'), os.path.join(item, 'PrivateKey.txt')))
+                break
+    return jobs
+
+
+def distinct(jobs):
+    """
+    Rejecting the items whose output directory (<out>/<name of the file>) is already taken by an earlier item,
+    items running in parallel would overwrite each other's containers and keys (a.png and a.bmp)
+    :param jobs: list of tuples (the first path names the output directory)
+    :return: accepted jobs, list of (item, error)
+    """
+    accepted, rejected, names = [], [], {}
+    for job in jobs:
+        name = stem(job[0])
+        if name in names:
+            rejected.append((job[0], 'ValueError: the output directory {} is already used by {}'.format(name, names[name])))
+        else:
+            names[name] = job[0]
+            accepted.append(job)
+    return accepted, rejected
+
+
+def embed_one(carrier, payload, out, mode, method, codec=None, level=None, depth=engine.DEFAULT_DEPTH):
+    """
+    Embedding one message (runs in a worker process)
+    :param carrier: path to the image-container
+    :param payload: path to the message (any file, read chunk by chunk except in the 'stream' method)
+    :param out: output directory
+    :param mode: generator mode
+    :param method: 'image' (decode with PIL), 'stream' (24-bit BMP band by band) or 'mmap' (24-bit BMP memory map)
+    :param codec: compression of the message (one of engine.CODECS, optional)
+    :param level: compression level (optional)
+    :param depth: bits per channel (one of engine.DEPTHS)
+    :return: number of bytes read, timings of the stages (see metrics.StageTimer.record)
+    """
+    timer = metrics.StageTimer('embed', container=carrier, method=method)
+    item = os.path.join(out, stem(carrier))
+    os.makedirs(item, exist_ok=True)
+    with open(payload, 'rb') as message:
+        if method == 'stream':
+            key = engine.embed_stream(carrier, os.path.join(item, stem(carrier) + '.bmp'), message, mode, timer=timer,
+                                      codec=codec, level=level, depth=depth)
+        elif method == 'mmap':
+            key = engine.embed_mmap(carrier, os.path.join(item, stem(carrier) + '.bmp'), message, mode, timer=timer,
+                                    codec=codec, level=level, depth=depth)
+        else:
+            image, key = engine.embed(carrier, message, mode, timer=timer, codec=codec, level=level, depth=depth)
+            with timer.stage(metrics.SAVE):
+                image.save(os.path.join(item, stem(carrier) + engine.container_suffix(image.mode)))
+    with timer.stage(metrics.KEY_WRITE):
+        with open(os.path.join(item, 'PublicKey.txt'), 'w') as f:
+            f.write(key[0])
+        with open(os.path.join(item, 'PrivateKey.txt'), 'w') as f:
+            f.write(key[1])
+    return os.path.getsize(carrier) + os.path.getsize(payload), timer.record()
+
+
+def extract_one(container, public_key, private_key, out, method):
+    """
+    Extracting one message (runs in a worker process)
+    :param container: path to the filled container
+    :param public_key: path to the public key
+    :param private_key: path to the private key
+    :param out: output directory
+    :param method: 'image' (decode with PIL), 'stream' (24-bit BMP band by band) or 'mmap' (24-bit BMP memory map)
+    :return: number of bytes read, timings of the stages (see metrics.StageTimer.record)
+    """
+    timer = metrics.StageTimer('extract', container=container, method=method)
+    with timer.stage(metrics.OPEN):
+        with open(public_key) as f:
+            pub_key = f.read()
+        with open(private_key) as f:
+            pri_key = f.read()
+        # a wrong key is rejected before the message file is created
+        engine.read_key((pub_key, pri_key))
+    item = os.path.join(out, stem(container))
+    os.makedirs(item, exist_ok=True)
+    message = os.path.join(item, 'StegoText.txt')
+    # the message is written while it is extracted ('stream' writes it at the end), a failed extraction leaves no file
+    with engine.removed_on_error(message), open(message, 'wb') as f:
+        if method == 'stream':
+            engine.extract_stream(container, (pub_key, pri_key), timer=timer, out=f)
+        elif method == 'mmap':
+            engine.extract_mmap(container, (pub_key, pri_key), timer=timer, out=f)
+        else:
+            engine.extract(container, (pub_key, pri_key), timer=timer, out=f)
+    return os.path.getsize(container), timer.record()
+
+
+def preflight(jobs, depth=engine.DEFAULT_DEPTH, codec=None):
+    """
+    Rejecting the messages that do not fit into their carriers (only the headers of the images are read)
+    :param jobs: list of (carrier, payload)
+    :param depth: bits per channel
+    :param codec: compression of the messages (a message to be compressed is checked after compression)
+    :return: accepted jobs, list of (carrier, error)
+    """
+    accepted, rejected = [], []
+    for carrier, payload in jobs:
+        try:
+            engine.preflight(carrier, payload, depth, codec)
+        except (OSError, ValueError) as e:
+            rejected.append((carrier, '{}: {}'.format(type(e).__name__, e)))
+        else:
+            accepted.append((carrier, payload))
+    return accepted, rejected
+
+
+def run(command, source, out, workers=None, mode=engine.DEFAULT_MODE, method='image', codec=None, level=None,
+        depth=engine.DEFAULT_DEPTH):
+    """
+    Processing all items on a pool of processes (messages that do not fit are rejected before, see preflight)
+    :param command: 'embed' or 'extract'
+    :param source: directory or manifest
+    :param out: output directory
+    :param workers: number of processes (all available cores by default)
+    :param mode: generator mode (embed)
+    :param method: 'image' (decode with PIL), 'stream' (24-bit BMP band by band) or 'mmap' (24-bit BMP memory map)
+    :param codec: compression of the messages (embed, one of engine.CODECS, optional)
+    :param level: compression level (embed, optional)
+    :param depth: bits per channel (embed, one of engine.DEPTHS)
+    :return: number of processed items, list of (item, error)
+    (the timings of the stages of every item are written to the log 'stego.metrics' as JSON lines)
+    """
+    os.makedirs(out, exist_ok=True)
+    start = time.perf_counter()
+    failures = []
+    if command == 'embed':
+        jobs, failures = distinct(embed_jobs(source))
+        jobs, rejected = preflight(jobs, depth, codec)
+        failures += rejected
+        args = [(carrier, payload, out, mode, method, codec, level, depth) for carrier, payload in jobs]
+        func = embed_one
+    else:
+        jobs, failures = distinct(extract_jobs(source))
+        args = [(container, pub, pri, out, method) for container, pub, pri in jobs]
+        func = extract_one
+    done, size = 0, 0
+    with ProcessPoolExecutor(max_workers=workers or available_cores()) as pool:
+        futures = [(job[0], pool.submit(func, *job)) for job in args]
+        for item, future in futures:
+            try:
+                read, record = future.result()
+                metrics.logger.info(json.dumps(record))
+                size += read
+                done += 1
+            except Exception as e:
+                failures.append((item, '{}: {}'.format(type(e).__name__, e)))
+    seconds = time.perf_counter() - start
+    print('{}: {} done, {} failed in {:.2f} s ({:.2f} images/s, {:.2f} MB/s)'.format(
+        command, done, len(failures), seconds, done / seconds, size / 2 ** 20 / seconds))
+    for item, error in failures:
+        print('failed: {} ({})'.format(item, error))
+    return done, failures
+
+
+def main(argv=None):
+    """
+    Parsing the command line and starting the batch
+    :param argv: arguments
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(description='Batch LSB steganography')
+    parser.add_argument('command', choices=('embed', 'extract'))
+    parser.add_argument('source', help='directory or manifest (.csv)')
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes (default: available cores)')
+    parser.add_argument('--mode', choices=engine.EMBED_MODES, default=engine.DEFAULT_MODE, help='generator mode (embed)')
+    method = parser.add_mutually_exclusive_group()
+    method.add_argument('--stream', dest='method', action='store_const', const='stream', default='image',
+                        help='process 24-bit BMP images band by band (bounded memory)')
+    method.add_argument('--mmap', dest='method', action='store_const', const='mmap',
+                        help='process 24-bit BMP images through a memory map (only touched bytes are read/written)')
+    parser.add_argument('--depth', type=int, choices=engine.DEPTHS, default=engine.DEFAULT_DEPTH,
+                        help='least significant bits of a channel holding the message (embed, stored in the key)')
+    parser.add_argument('--compress', choices=engine.CODECS, default=None, help='compression of the messages (embed)')
+    parser.add_argument('--level', type=int, choices=range(1, 10), default=None, metavar='1-9',
+                        help='compression level (embed, default: default level of the codec)')
+    parser.add_argument('--metrics', action='store_true', help='print the timings of the stages of every item as JSON lines')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    done, failures = run(args.command, args.source, args.out, args.workers, args.mode, args.method, args.compress, args.level,
+                         args.depth)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""
+Benchmark suite of the Steganography application
+Every stage (to_textb, prng, embed, extract, show_rgb, show_pix) runs headless in its own process
+on a seeded synthetic carrier and payload; wall time, pixels/s and the peak memory of the stage are reported as JSON
+
+    python benchmark.py run [--sizes 0.1 1 10 100] [--payloads 1024 65536 full] [--variant engine|legacy] [-o FILE]
+    python benchmark.py compare OLD.json NEW.json    (two revisions, or the engine and legacy variants)
+    python benchmark.py check [megapixels] [message length]    (engine against the per-pixel loops, same output)
+
+The legacy variant runs copies of the per-pixel loops that ALL.py and Stego.py used before the engine was added
+(reimplemented here without the GUI and the files, ALL.py and Stego.py themselves are not run)
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PIL import Image
+
+import engine
+
+# to_textb: unpacking of the payload into symbols of depth bits (engine.to_symbols over the chunks of the framed payload)
+STAGES = ('to_textb', 'prng', 'embed', 'extract', 'show_rgb', 'show_pix')
+VARIANTS = ('engine', 'legacy')
+
+
+def legacy_stego(image, prng, text):
+    """
+    The per-pixel embedding loop (getpixel/putpixel for every pixel)
+    :param image: image-container
+    :param prng: list of pseudo-random pixels
+    :param text: message (list of blocks of 6 bits)
+    :return: filled container
+    """
+    def change_bits(num, index, to):
+        if not to:
+            return ~(1 << index) & num
+        return (1 << index) | num
+
+    text_i = 0
+    for i in prng:
+        i1, j1 = (i + image.size[1] - 1) // image.size[1] - 1, (image.size[1] - 1, i % image.size[1])[bool(i % image.size[1])]
+        pixel = image.getpixel((i1, j1))
+        cur = text[text_i]
+        new = list(pixel)
+        for c in range(len(cur) // 2):
+            new[c] = change_bits(change_bits(pixel[c], 1, int(cur[2 * c])), 0, int(cur[2 * c + 1]))
+        image.putpixel((i1, j1), tuple(new))
+        text_i += 1
+    return image
+
+
+def legacy_unstego(image, prng):
+    """
+    The per-pixel extraction loop (string of bits built pixel by pixel)
+    :param image: filled container
+    :param prng: list of pseudo-random pixels
+    :return: message
+    """
+    def get_bit(num, index):
+        return int(bool(num & (1 << index)))
+
+    text = ''
+    for i in prng:
+        i1, j1 = (i + image.size[1] - 1) // image.size[1] - 1, (image.size[1] - 1, i % image.size[1])[bool(i % image.size[1])]
+        R, G, B = image.getpixel((i1, j1))
+        text += str(get_bit(R, 1)) + str(get_bit(R, 0)) + str(get_bit(G, 1)) + str(get_bit(G, 0)) + str(get_bit(B, 1)) + str(get_bit(B, 0))
+    text_end = ''
+    for i in range(0, len(text) // 8 * 8, 8):
+        text_end += chr(int(text[i:i + 8], 2))
+    return text_end
+
+
+def legacy_to_textb(payload):
+    """
+    Converting a message to binary by string concatenation and dividing it into blocks of 6 bits
+    :param payload: message (bytes)
+    :return: list of blocks
+    """
+    text_b = ''
+    for i in payload.decode('latin-1'):
+        text_b += bin(ord(i))[2:].rjust(8, '0')
+    return [text_b[i:i + 6] for i in range(0, len(text_b), 6)]
+
+
+def legacy_prng(width, height, number, seed):
+    """
+    random.shuffle of the list of all pixels
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :param seed: seed of the generator
+    :return: list of pseudo-random pixels (column-major numbers)
+    """
+    all_list = list(range(0, width * height - 1))
+    random.seed(seed)
+    random.shuffle(all_list)
+    return all_list[:number]
+
+
+def legacy_show_rgb(img):
+    """
+    The per-pixel loop of least significant bits demonstration
+    :param img: image
+    :return: image
+    """
+    def get_bit(num, index):
+        return int(bool(num & (1 << index)))
+
+    w, h = img.size[0], img.size[1]
+    for i in range(w):
+        for j in range(h):
+            pixel = img.getpixel((i, j))
+            R, G, B = pixel
+            color = [R, G, B]
+            new_color = [0, 0, 0]
+            for col_i in range(3):
+                col = color[col_i]
+                if get_bit(col, 1) and get_bit(col, 0):
+                    new_color[col_i] = 255
+                if get_bit(col, 1) and not get_bit(col, 0):
+                    new_color[col_i] = 170
+                if not get_bit(col, 1) and get_bit(col, 0):
+                    new_color[col_i] = 85
+                if not get_bit(col, 1) and not get_bit(col, 0):
+                    new_color[col_i] = 0
+            img.putpixel((i, j), (new_color[0], new_color[1], new_color[2]))
+    return img
+
+
+def legacy_show_pix(size, prng):
+    """
+    The per-pixel loop of the pixel distribution map
+    :param size: (width, height)
+    :param prng: list of pseudo-random pixels (column-major numbers)
+    :return: image
+    """
+    w, h = size
+    used_pix = Image.new('RGB', (w, h), (255, 255, 255))
+    for i in prng:
+        i1, j1 = (i + h - 1) // h - 1, (h - 1, i % h)[bool(i % h)]
+        used_pix.putpixel((i1, j1), (0, 0, 0))
+    return used_pix
+
+
+def carrier(width, height, seed=0):
+    """
+    Creating a random RGB image
+    :param width: picture width
+    :param height: picture height
+    :param seed: seed of the generator
+    :return: image
+    """
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), 'RGB')
+
+
+def message(length, seed=0):
+    """
+    Creating a random message split into blocks of 6 bits
+    :param length: number of characters
+    :param seed: seed of the generator
+    :return: list of blocks
+    """
+    rnd = random.Random(seed)
+    bits = ''.join(bin(rnd.randint(32, 126))[2:].rjust(8, '0') for _ in range(length))
+    return [bits[i:i + 6] for i in range(0, len(bits), 6)]
+
+
+def payload(length, seed=0):
+    """
+    Creating a random payload
+    :param length: number of bytes
+    :param seed: seed of the generator
+    :return: bytes
+    """
+    return np.random.default_rng(seed + 1).bytes(length)
+
+
+def capacity(width, height, depth=engine.DEFAULT_DEPTH):
+    """
+    Maximum payload of a container (3 * depth bits per pixel, the header of the message included)
+    :param width: picture width
+    :param height: picture height
+    :param depth: bits per channel
+    :return: number of bytes
+    """
+    return width * height * 3 * depth // 8 - engine.HEADER.size
+
+
+def side(megapixels):
+    """
+    Side of a square container
+    :param megapixels: size of the container
+    :return: number of pixels
+    """
+    return max(2, int((megapixels * 10 ** 6) ** 0.5))
+
+
+def peak_memory(func, *args):
+    """
+    Peak memory allocated by one call (NumPy arrays and Python objects traced by tracemalloc,
+    the pixel buffers of PIL images are not traced), the memory held before the call is not counted.
+    The call is run again for this, so the tracing does not slow down the timed run
+    :param func: stage
+    :param args: arguments of the stage
+    :return: megabytes
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def measure(variant, stage, width, height, length, mode, seed, depth=engine.DEFAULT_DEPTH):
+    """
+    Running one stage (the stages it depends on run first and are not timed)
+    :param variant: 'engine' or 'legacy'
+    :param stage: one of STAGES
+    :param width: picture width
+    :param height: picture height
+    :param length: payload length
+    :param mode: generator mode (engine variant)
+    :param seed: seed of the carrier, the payload and the generator
+    :param depth: bits per channel (engine variant)
+    :return: result (dict)
+    """
+    if variant == 'engine':
+        steps = {
+            'to_textb': lambda data: [engine.to_symbols(chunk, depth) for chunk in engine.payload_chunks(data)[1]],
+            # the positions of the feistel mode are computed when they are used, numpy.asarray times all of them here
+            'prng': lambda n: np.asarray(engine.positions(mode, seed, width, height, n)),
+            'embed': lambda image, prng, chunks: engine.embed_pixels(image, prng, chunks, depth=depth),
+            'extract': lambda image, prng: engine.extract_pixels(image, prng, depth=depth),
+            'show_rgb': engine.lsb_image,
+            'show_pix': engine.used_pixels,
+        }
+    else:
+        steps = {
+            'to_textb': legacy_to_textb,
+            'prng': lambda n: legacy_prng(width, height, n, seed),
+            'embed': legacy_stego,
+            'extract': legacy_unstego,
+            'show_rgb': legacy_show_rgb,
+            'show_pix': legacy_show_pix,
+        }
+    timing = {}
+    memory = {}
+
+    def step(name, *args):
+        t = time.perf_counter()
+        result = steps[name](*args)
+        timing[name] = time.perf_counter() - t
+        if name == stage:
+            memory[name] = peak_memory(steps[name], *args)
+        return result
+
+    image = carrier(width, height, seed)
+    data = payload(length, seed)
+    text = step('to_textb', data)
+    # the engine embeds the chunks of bytes (unpacked again chunk by chunk as part of 'embed')
+    chunks = list(engine.payload_chunks(data)[1]) if variant == 'engine' else text
+    pixels = engine.byte_pixels(engine.HEADER.size + length, depth) if variant == 'engine' else len(text)
+    if stage != 'to_textb':
+        prng = step('prng', pixels)
+        if stage == 'show_pix':
+            step('show_pix', (width, height), prng)
+        elif stage != 'prng':
+            stego = step('embed', image, prng, chunks)
+            if stage == 'extract':
+                step('extract', stego, prng)
+            elif stage == 'show_rgb':
+                step('show_rgb', stego)
+                pixels = width * height
+    seconds = timing[stage]
+    return {
+        'variant': variant, 'stage': stage, 'width': width, 'height': height,
+        'megapixels': width * height / 10 ** 6, 'payload': length, 'pixels': pixels,
+        'seconds': seconds, 'pixels_per_s': pixels / seconds if seconds else None, 'peak_mb': memory[stage],
+    }
+
+
+def revision():
+    """
+    Current git revision of the repository (if there is one)
+    :return: revision or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, payloads, stages, variant, mode, seed=0, depth=engine.DEFAULT_DEPTH):
+    """
+    Running the suite, every stage of every case in a fresh process
+    :param sizes: sizes of containers (megapixels)
+    :param payloads: payload lengths in bytes or 'full' (capacity of the container)
+    :param stages: stages to run
+    :param variant: 'engine' or 'legacy'
+    :param mode: generator mode (engine variant)
+    :param seed: seed of the carrier, the payload and the generator
+    :param depth: bits per channel (engine variant)
+    :return: report (dict)
+    """
+    results = []
+    for megapixels in sizes:
+        width = height = side(megapixels)
+        lengths = []
+        for p in payloads:
+            length = capacity(width, height, depth) if p == 'full' else int(p)
+            if length <= capacity(width, height, depth) and length not in lengths:
+                lengths.append(length)
+        for length in lengths:
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    try:
+                        result = pool.submit(measure, variant, stage, width, height, length, mode, seed, depth).result()
+                    except Exception as e:
+                        result = {'variant': variant, 'stage': stage, 'width': width, 'height': height,
+                                  'megapixels': width * height / 10 ** 6, 'payload': length,
+                                  'error': '{}: {}'.format(type(e).__name__, e)}
+                results.append(result)
+                print(format_result(result), file=sys.stderr)
+    return {
+        'revision': revision(), 'variant': variant, 'mode': mode, 'seed': seed, 'depth': depth,
+        'python': platform.python_version(), 'numpy': np.__version__, 'results': results,
+    }
+
+
+def format_result(result):
+    """
+    One line of progress
+    :param result: result (dict)
+    :return: string
+    """
+    case = '{:<8} {:>7.2f} MP {:>10} B'.format(result['stage'], result['megapixels'], result['payload'])
+    if 'error' in result:
+        return '{}  error: {}'.format(case, result['error'])
+    return '{}  {:>9.4f} s  {:>12.0f} px/s  {:.0f} MB'.format(
+        case, result['seconds'], result['pixels_per_s'] or 0, result['peak_mb'])
+
+
+def compare(old, new):
+    """
+    Printing the difference between two reports
+    :param old: report (dict)
+    :param new: report (dict)
+    """
+    def key(result):
+        return result['stage'], result['width'], result['height'], result['payload']
+
+    before = {key(r): r for r in old['results'] if 'error' not in r}
+    print('{} ({}) -> {} ({})'.format(old.get('revision'), old.get('variant'), new.get('revision'), new.get('variant')))
+    print('{:<8} {:>7} {:>10} {:>10} {:>10} {:>8} {:>14}'.format('stage', 'MP', 'payload', 'old s', 'new s', 'speedup', 'peak MB'))
+    for result in new['results']:
+        if 'error' in result or key(result) not in before:
+            continue
+        a = before[key(result)]
+        # reports made before peak_mb have no memory of the stage
+        memory = '{:.0f} -> {:.0f}'.format(a['peak_mb'], result['peak_mb']) if 'peak_mb' in a else ''
+        print('{:<8} {:>7.2f} {:>10} {:>10.4f} {:>10.4f} {:>7.1f}x {:>14}'.format(
+            result['stage'], result['megapixels'], result['payload'], a['seconds'], result['seconds'],
+            a['seconds'] / result['seconds'] if result['seconds'] else float('inf'), memory))
+
+
+def check(megapixels, length):
+    """
+    Running both implementations on the same data and printing the results
+    :param megapixels: size of the container
+    :param length: message length
+    """
+    side = int((megapixels * 10 ** 6) ** 0.5)
+    image = carrier(side, side)
+    text = message(length)
+    bits = ''.join(text)
+    # without the header, as the per-pixel loop writes it (extraction returns a message without a header as it is)
+    raw = bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+    all_list = list(range(0, side * side - 1))
+    random.seed(1)
+    random.shuffle(all_list)
+    prng = all_list[:len(text)]
+    positions = engine.legacy_positions(prng, side, side)
+
+    t = time.perf_counter()
+    new = engine.embed_pixels(image, positions, [raw])
+    t_new = time.perf_counter() - t
+
+    t = time.perf_counter()
+    old = legacy_stego(image.copy(), prng, text)
+    t_old = time.perf_counter() - t
+
+    t = time.perf_counter()
+    new_text = engine.extract_pixels(new, positions, legacy=True)
+    t_new_d = time.perf_counter() - t
+
+    t = time.perf_counter()
+    old_text = legacy_unstego(old, prng)
+    t_old_d = time.perf_counter() - t
+    # a message without a header is extracted without its non-ASCII bytes (see engine.unframe)
+    old_text = old_text.encode('latin-1').translate(None, engine.NOT_ASCII)
+
+    print('container: {}x{}, message: {} chars, pixels: {}'.format(side, side, length, len(prng)))
+    print('embedding:  per-pixel loop {:.3f} s, engine {:.3f} s, speedup {:.1f}x, identical: {}'.format(
+        t_old, t_new, t_old / t_new, old.tobytes() == new.tobytes()))
+    print('extraction: per-pixel loop {:.3f} s, engine {:.3f} s, speedup {:.1f}x, identical: {}'.format(
+        t_old_d, t_new_d, t_old_d / t_new_d, old_text == new_text))
+    for mode in engine.MODES:
+        t = time.perf_counter()
+        np.asarray(engine.positions(mode, 1, side, side, len(text)))
+        print('generator ({}): {:.3f} s'.format(mode, time.perf_counter() - t))
+
+
+def main(argv=None):
+    """
+    Parsing the command line
+    :param argv: arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmark suite of the Steganography application')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p_run = commands.add_parser('run', help='run the suite and write a JSON report')
+    p_run.add_argument('--sizes', nargs='+', type=float, default=[0.1, 1, 10], help='container sizes in megapixels (up to 100)')
+    p_run.add_argument('--payloads', nargs='+', default=['1024', '65536', '1048576', 'full'], help="payload sizes in bytes or 'full'")
+    p_run.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    p_run.add_argument('--variant', choices=VARIANTS, default='engine')
+    p_run.add_argument('--mode', choices=engine.MODES, default=engine.DEFAULT_MODE, help='generator mode (engine variant)')
+    p_run.add_argument('--depth', type=int, choices=engine.DEPTHS, default=engine.DEFAULT_DEPTH, help='bits per channel (engine variant)')
+    p_run.add_argument('--seed', type=int, default=0)
+    p_run.add_argument('-o', '--output', help='JSON report (default: stdout)')
+    p_compare = commands.add_parser('compare', help='compare two JSON reports')
+    p_compare.add_argument('old')
+    p_compare.add_argument('new')
+    p_check = commands.add_parser('check', help='engine against the per-pixel loops on one case')
+    p_check.add_argument('megapixels', nargs='?', type=float, default=1)
+    p_check.add_argument('length', nargs='?', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.sizes, args.payloads, args.stages, args.variant, args.mode, args.seed, args.depth)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+    elif args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        compare(old, new)
+    else:
+        check(args.megapixels, args.length)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Reading and writing the pixel array of uncompressed 24-bit BMP files without decoding the whole image
+"""
+import struct
+
+from collections import namedtuple
+
+import numpy as np
+
+Header = namedtuple('Header', 'offset width height stride top_down')
+
+
+def read_header(f):
+    """
+    Reading the BMP header
+    :param f: binary file
+    :return: Header (offset of the pixel array, width, height, length of a row in bytes, order of rows)
+    """
+    f.seek(0)
+    data = f.read(54)
+    if len(data) < 54 or data[:2] != b'BM':
+        raise ValueError('Not a BMP file')
+    offset, dib_size = struct.unpack_from('<II', data, 10)
+    width, height, planes, bpp, compression = struct.unpack_from('<iiHHI', data, 18)
+    if dib_size < 40 or bpp != 24 or compression != 0:
+        raise ValueError('Only uncompressed 24-bit BMP files are supported')
+    return Header(offset, width, abs(height), (width * 3 + 3) & ~3, height < 0)
+
+
+def file_rows(header, y):
+    """
+    Converting picture rows into rows of the file (BMP rows are stored bottom-up unless the height is negative)
+    :param header: Header
+    :param y: array of picture rows
+    :return: array of file rows
+    """
+    if header.top_down:
+        return y
+    return header.height - 1 - y
+
+
+def read_rows(f, header, first, count):
+    """
+    Reading rows of the file
+    :param f: binary file
+    :param header: Header
+    :param first: first file row
+    :param count: number of rows
+    :return: writable array (count x row length)
+    """
+    f.seek(header.offset + first * header.stride)
+    rows = np.frombuffer(bytearray(f.read(count * header.stride)), dtype=np.uint8)
+    return rows.reshape(count, header.stride)
+
+
+def pixels(rows, header):
+    """
+    RGB view of rows of the file (without padding, channels in R, G, B order)
+    :param rows: array of rows (see read_rows)
+    :param header: Header
+    :return: view (rows x width x 3)
+    """
+    return rows[:, :header.width * 3].reshape(len(rows), header.width, 3)[..., ::-1]
+
+
+def map_rows(mm, header):
+    """
+    Array of the rows of a memory-mapped file (no copy: writes go straight to the file)
+    :param mm: mmap of the whole file
+    :param header: Header
+    :return: array (height x row length) in the order of the file
+    """
+    return np.frombuffer(mm, dtype=np.uint8, count=header.height * header.stride, offset=header.offset).reshape(header.height, header.stride)
+
+
+def file_positions(header, prng):
+    """
+    Converting positions in the picture into positions in the rows of the file
+    :param header: Header
+    :param prng: array of positions (y * width + x)
+    :return: array of positions (file row * width + x)
+    """
+    y, x = np.divmod(np.asarray(prng, dtype=np.int64), header.width)
+    return file_rows(header, y) * header.width + x
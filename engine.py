@@ -0,0 +1,1281 @@
+"""
+Headless LSB engine used by the Steganography application (no PyQt5 here)
+The carrier is turned into a NumPy array, the payload is scattered into all selected pixels at once
+and the result is written back into an image a single time
+
+    stego_image, key = engine.embed(image, payload)
+    payload = engine.extract(stego_image, key)
+"""
+import bz2
+import hashlib
+import io
+import itertools
+import lzma
+import mmap
+import os
+import random
+import secrets
+import shutil
+import struct
+import tempfile
+import traceback
+import zlib
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from PIL import Image
+from cryptography.fernet import Fernet
+
+import bmp
+import metrics
+
+
+# ----------------------Pixel selection--------------------------
+
+SHUFFLE = 'shuffle'  # random.shuffle of the whole list of pixels (keys without a mode)
+SAMPLE = 'sample'    # partial Fisher-Yates over the pixels that are actually needed
+FEISTEL = 'feistel'  # keyed Feistel permutation, the i-th pixel is computed directly
+PCG64 = 'pcg64.1'    # NumPy PCG64 bit stream, version 1 of the sampling algorithm
+
+MODES = (SHUFFLE, SAMPLE, FEISTEL, PCG64)
+# modes of new keys: the column-major mapping of the shuffle mode puts pixel numbers k*h and k*h-1 on the same pixel,
+# so it only extracts the messages of old keys
+EMBED_MODES = (SAMPLE, FEISTEL, PCG64)
+DEFAULT_MODE = PCG64
+
+FEISTEL_ROUNDS = 6
+
+
+def legacy_positions(prng, width, height):
+    """
+    Converting numbers of pseudo-random pixels of the shuffle mode into positions in the pixel array
+    (the column-major mapping of the per-pixel loop: 0 is the last pixel and a column ends on its own last row)
+    :param prng: list of pseudo-random pixels
+    :param width: picture width
+    :param height: picture height
+    :return: array of positions (y * width + x)
+    """
+    prng = np.asarray(prng, dtype=np.int64)
+    x = (prng - 1) // height % width
+    y = prng % height
+    y[y == 0] = height - 1
+    return (y * width + x).astype(np.uint32)
+
+
+def shuffle_positions(seed, width, height, number):
+    """
+    The generator of the shuffle mode (random.shuffle([0...number of pixels - 2]))
+    :param seed: seed of the generator
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :return: array of positions
+    """
+    all_list = list(range(0, width * height - 1))
+    random.seed(seed)
+    random.shuffle(all_list)
+    return legacy_positions(all_list[:number], width, height)
+
+
+def sample_positions(seed, width, height, number):
+    """
+    The generator of the sample mode: the first pixels of a keyed Fisher-Yates shuffle,
+    only the swapped cells are stored, so time and memory depend on the number of pixels, not on the picture size
+    :param seed: seed of the generator
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :return: array of positions
+    """
+    field = width * height
+    if number > field:
+        raise ValueError('The message does not fit into the container')
+    rnd = random.Random(seed)
+    swaps = {}
+    positions = []
+    for i in range(number):
+        j = rnd.randrange(i, field)
+        positions.append(swaps.get(j, j))
+        swaps[j] = swaps.pop(i, i)
+    return np.array(positions, dtype=np.uint32)
+
+
+def feistel_keys(seed):
+    """
+    Creating round keys of the Feistel permutation
+    :param seed: seed of the generator
+    :return: list of 64-bit round keys
+    """
+    keys = []
+    for r in range(FEISTEL_ROUNDS):
+        digest = hashlib.sha256('{} {}'.format(seed, r).encode('utf-8')).digest()
+        keys.append(np.uint64(int.from_bytes(digest[:8], 'little')))
+    return keys
+
+
+def feistel_round(half, key, mask):
+    """
+    Round function of the Feistel permutation (splitmix64 finalizer)
+    :param half: array of right halves
+    :param key: round key
+    :param mask: mask of a half
+    :return: array of values for xor with left halves
+    """
+    z = half + key
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return (z ^ (z >> np.uint64(31))) & mask
+
+
+def feistel_permute(seed, field, index):
+    """
+    Keyed bijection of [0, field) onto itself (balanced Feistel network with cycle-walking)
+    :param seed: seed of the generator
+    :param field: size of the domain (number of pixels)
+    :param index: array of numbers in [0, field)
+    :return: array of their images
+    """
+    bits = max(2, (field - 1).bit_length())
+    half = np.uint64((bits + 1) // 2)
+    mask = np.uint64((1 << int(half)) - 1)
+    keys = feistel_keys(seed)
+
+    def permute(x):
+        left, right = x >> half, x & mask
+        for key in keys:
+            left, right = right, left ^ feistel_round(right, key, mask)
+        return (left << half) | right
+
+    result = permute(np.asarray(index, dtype=np.uint64))
+    outside = np.flatnonzero(result >= field)
+    while len(outside):
+        result[outside] = permute(result[outside])
+        outside = outside[result[outside] >= field]
+    return result.astype(np.uint32)
+
+
+def feistel_positions(seed, width, height, number, start=0):
+    """
+    The generator of the feistel mode: pixels number start...start + number - 1 of a keyed permutation,
+    every slice is computed on its own without building the previous ones (see LazyPositions)
+    :param seed: seed of the generator
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :param start: number of the first pixel
+    :return: array of positions
+    """
+    field = width * height
+    if start + number > field:
+        raise ValueError('The message does not fit into the container')
+    return feistel_permute(seed, field, np.arange(start, start + number, dtype=np.uint64))
+
+
+class LazyPositions:
+    """
+    Positions computed slice by slice: the chunked kernels (write_stream, read_stream) ask only for the slice of the chunk
+    they process, so the positions of the whole message are never in memory at once.
+    numpy.asarray computes all of them (pictures of the used pixels, band by band processing)
+    """
+    def __init__(self, generate, number):
+        """
+        :param generate: function (first, count) -> array of positions first...first + count - 1
+        :param number: number of positions
+        """
+        self.generate = generate
+        self.number = number
+
+    def __len__(self):
+        return self.number
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, stop, step = index.indices(self.number)
+            if step == 1:
+                return self.generate(first, max(0, stop - first))
+            return np.asarray(self)[index]
+        if index < 0:
+            index += self.number
+        if not 0 <= index < self.number:
+            raise IndexError('position index out of range')
+        return self.generate(index, 1)[0]
+
+    def __array__(self, dtype=None, copy=None):
+        result = self.generate(0, self.number)
+        return result if dtype is None else result.astype(dtype)
+
+
+def pcg64_positions(seed, width, height, number):
+    """
+    The generator of the pcg64.1 mode. It depends only on the raw PCG64 bit stream (stable across NumPy versions),
+    not on the random module of the interpreter.
+    Sparse messages: 32-bit draws scaled onto the pixels, repeated pixels are dropped (the first draw is kept)
+    Dense messages (more than a quarter of the pixels): pixels sorted by random keys (pixel number in the low bits)
+    :param seed: seed of the generator
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :return: array of positions
+    """
+    field = width * height
+    if number > field:
+        raise ValueError('The message does not fit into the container')
+    bit_generator = np.random.PCG64(seed)
+    if 4 * number > field:
+        bits = np.uint64(max(1, (field - 1).bit_length()))
+        keys = bit_generator.random_raw(field) >> bits << bits | np.arange(field, dtype=np.uint64)
+        return (np.sort(keys)[:number] & ((np.uint64(1) << bits) - np.uint64(1))).astype(np.uint32)
+    drawn = np.empty(0, dtype=np.uint32)
+    while len(drawn) < number:
+        need = number - len(drawn)
+        raw = bit_generator.random_raw(need + need // 4 + 16)
+        raw >>= np.uint64(32)
+        raw *= np.uint64(field)
+        raw >>= np.uint64(32)
+        drawn = np.concatenate((drawn, raw.astype(np.uint32)))
+        del raw
+        first = np.unique(drawn, return_index=True)[1]
+        first.sort()
+        drawn = drawn[first]
+    return drawn[:number]
+
+
+def positions(mode, seed, width, height, number):
+    """
+    Generating the positions of pseudo-random pixels
+    :param mode: generator mode (one of MODES)
+    :param seed: seed of the generator
+    :param width: picture width
+    :param height: picture height
+    :param number: number of pixels
+    :return: array of positions (y * width + x, numpy.uint32), LazyPositions in the feistel mode
+    """
+    if width * height > 1 << 32:
+        raise ValueError('The container is too large')
+    if mode == SHUFFLE:
+        return shuffle_positions(seed, width, height, number)
+    if mode == SAMPLE:
+        return sample_positions(seed, width, height, number)
+    if mode == FEISTEL:
+        if number > width * height:
+            raise ValueError('The message does not fit into the container')
+        return LazyPositions(lambda first, count: feistel_positions(seed, width, height, count, first), number)
+    if mode == PCG64:
+        return pcg64_positions(seed, width, height, number)
+    raise ValueError('Unknown generator mode: {}'.format(mode))
+
+
+# --------------------------Keys--------------------------------
+
+DEPTHS = (1, 2, 3, 4)  # number of least significant bits of a channel holding the message
+DEFAULT_DEPTH = 2      # also the depth of keys without a depth
+
+
+def check_mode(mode):
+    """
+    Checking that a new key can use a generator mode
+    :param mode: generator mode
+    """
+    if mode == SHUFFLE:
+        raise ValueError('The shuffle mode only extracts messages of old keys, use one of: {}'.format(', '.join(EMBED_MODES)))
+    if mode not in EMBED_MODES:
+        raise ValueError('Unknown generator mode: {}'.format(mode))
+
+
+def create_key(number, mode=DEFAULT_MODE, depth=DEFAULT_DEPTH):
+    """
+    Creating a key
+    :param number: number of pixels
+    :param mode: generator mode (one of EMBED_MODES)
+    :param depth: bits per channel (one of DEPTHS)
+    :return: seed of the generator, (encrypted key, key for decrypting)
+    """
+    check_mode(mode)
+    if depth not in DEPTHS:
+        raise ValueError('Unsupported depth: {}'.format(depth))
+    seed = secrets.randbits(64)
+    just_1 = random.randint(1, 1024)
+    just_2 = hashlib.sha256(str(just_1).encode('utf-8')).hexdigest()
+    s = '{} {} {} {} {} {}'.format(just_1, seed, number, just_2, mode, depth)
+    c_key = Fernet.generate_key()
+    cipher = Fernet(c_key)
+    e_txt = cipher.encrypt(bytes(s, 'utf-8'))
+    return seed, (e_txt.decode('utf-8'), c_key.decode('utf-8'))
+
+
+def read_key(key):
+    """
+    Decrypting the key
+    :param key: (encrypted key, key for decrypting)
+    :return: parameters for generator (seed, number of pixels, mode), bits per channel
+             and True for a key of a version before the header of the message (a message without a header is expected)
+    """
+    e_txt, c_key = key
+    cipher = Fernet(bytes(c_key.strip(), 'utf-8'))
+    txt_list = cipher.decrypt(bytes(e_txt.strip(), 'utf-8')).decode('utf-8').split()
+    # keys with a depth came with the header, keys without a mode (shuffle) or without a depth are older
+    legacy = len(txt_list) < 6
+    if len(txt_list) == 4:
+        txt_list.append(SHUFFLE)
+    if len(txt_list) == 5:
+        txt_list.append(str(DEFAULT_DEPTH))
+    if len(txt_list) != 6 or txt_list[4] not in MODES or not all(i.isdigit() for i in txt_list[:3]):
+        raise ValueError('Invalid key')
+    if txt_list[5] not in [str(i) for i in DEPTHS]:
+        raise ValueError('Invalid key')
+    if hashlib.sha256(txt_list[0].encode('utf-8')).hexdigest() != txt_list[3]:
+        raise ValueError('Invalid key')
+    return int(txt_list[1]), int(txt_list[2]), txt_list[4], int(txt_list[5]), legacy
+
+
+# ------------------------Payload-------------------------------
+
+CHUNK = 1 << 16  # pixels processed between two reports of the progress (a multiple of 8: a whole number of bytes at any depth)
+CHUNK_BYTES = CHUNK * 3 // 4  # bytes of the message in a chunk (depth 2)
+MAGIC = b'\x89SG'  # a text message (the only kind before the header) never starts with it
+HEADER = struct.Struct('<3sBQ')  # magic, flags, length of the message (12 bytes, 16 pixels)
+NOT_ASCII = bytes(range(128, 256))
+CODECS = ('zlib', 'lzma', 'bz2')  # compression of the message, flags of the header = position + 1 (0: not compressed)
+
+
+def to_symbols(payload, depth=DEFAULT_DEPTH):
+    """
+    Unpacking a message into values of depth bits, one value per channel of a pixel
+    (the kernels view them as pixels x channels, the last pixel can get fewer values than channels)
+    :param payload: message (bytes, bytearray or memoryview)
+    :param depth: bits per value (one of DEPTHS)
+    :return: array of values (numpy.uint8, the last value is padded with zero bits)
+    """
+    data = np.frombuffer(payload, dtype=np.uint8)
+    if 8 % depth == 0:
+        # a byte holds a whole number of values: shift and mask
+        shifts = np.arange(8 - depth, -1, -depth, dtype=np.uint8)
+        return ((data[:, None] >> shifts) & ((1 << depth) - 1)).reshape(-1)
+    # values cross the bytes: unpack the bits and group them
+    bits = np.unpackbits(data)
+    bits = np.concatenate((bits, np.zeros(-len(bits) % depth, dtype=np.uint8)))
+    shifts = np.arange(depth - 1, -1, -1, dtype=np.uint8)
+    return (bits.reshape(-1, depth) << shifts).sum(axis=1, dtype=np.uint8)
+
+
+def symbol_pixels(symbols, channels=3):
+    """
+    Number of pixels holding the values
+    :param symbols: array of values
+    :param channels: channels of a pixel
+    :return: number of pixels
+    """
+    return (len(symbols) + channels - 1) // channels
+
+
+def byte_pixels(length, depth=DEFAULT_DEPTH, channels=3):
+    """
+    Number of pixels holding a message
+    :param length: length of the message in bytes
+    :param depth: bits per channel
+    :param channels: channels of a pixel
+    :return: number of pixels
+    """
+    return (8 * length + channels * depth - 1) // (channels * depth)
+
+
+def frame(length, flags=0):
+    """
+    Header stored in front of the message, so extraction knows where the message ends
+    :param length: length of the message in bytes
+    :param flags: flags of the message
+    :return: header (bytes)
+    """
+    return HEADER.pack(MAGIC, flags, length)
+
+
+def payload_length(payload):
+    """
+    Length of a message without reading it
+    :param payload: message (bytes-like object, seekable binary file opened for reading or path to a file)
+    :return: number of bytes
+    """
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return memoryview(payload).nbytes
+    if isinstance(payload, (str, os.PathLike)):
+        return os.path.getsize(payload)
+    # also files without a descriptor (io.BytesIO)
+    position = payload.tell()
+    end = payload.seek(0, io.SEEK_END)
+    payload.seek(position)
+    return end - position
+
+
+def payload_chunks(payload, flags=0):
+    """
+    Splitting a message and its header into chunks (a file is read chunk by chunk while the chunks are embedded)
+    :param payload: message (bytes-like object or binary file opened for reading)
+    :param flags: flags of the message
+    :return: length of the message with the header, generator of chunks of bytes (CHUNK_BYTES, the last one can be shorter)
+    """
+    length = payload_length(payload)
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        data = memoryview(payload).cast('B')
+    else:
+        data = None
+    size = CHUNK_BYTES - HEADER.size
+
+    def generate():
+        if data is not None:
+            yield frame(length, flags) + data[:size]
+            for first in range(size, length, CHUNK_BYTES):
+                yield data[first:first + CHUNK_BYTES]
+        else:
+            yield frame(length, flags) + payload.read(size)
+            block = payload.read(CHUNK_BYTES)
+            while block:
+                yield block
+                block = payload.read(CHUNK_BYTES)
+
+    return HEADER.size + length, generate()
+
+
+def compressor(codec, level=None):
+    """
+    :param codec: one of CODECS
+    :param level: compression level (1...9, the default level of the codec if None)
+    :return: compressor object (compress, flush)
+    """
+    if codec == 'zlib':
+        return zlib.compressobj(-1 if level is None else level)
+    if codec == 'lzma':
+        return lzma.LZMACompressor(preset=level)
+    if codec == 'bz2':
+        return bz2.BZ2Compressor(9 if level is None else level)
+    raise ValueError('Unknown codec: {}'.format(codec))
+
+
+def decompressor(flags):
+    """
+    :param flags: flags of the header
+    :return: decompressor object (decompress) of the codec of the message
+    """
+    if not 0 < flags <= len(CODECS):
+        raise ValueError('Unknown codec of the message: {}'.format(flags))
+    codec = CODECS[flags - 1]
+    if codec == 'zlib':
+        return zlib.decompressobj()
+    if codec == 'lzma':
+        return lzma.LZMADecompressor()
+    return bz2.BZ2Decompressor()
+
+
+def compress(payload, codec, level=None):
+    """
+    Compressing a message (a file is compressed chunk by chunk into a temporary file)
+    :param payload: message (bytes-like object or binary file opened for reading)
+    :param codec: one of CODECS
+    :param level: compression level (optional)
+    :return: flags of the header, compressed message (bytes or temporary file), length of the message
+    """
+    packer = compressor(codec, level)
+    flags = CODECS.index(codec) + 1
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        data = packer.compress(payload) + packer.flush()
+        return flags, data, memoryview(payload).nbytes
+    data = tempfile.TemporaryFile()
+    length = 0
+    block = payload.read(CHUNK_BYTES)
+    while block:
+        length += len(block)
+        data.write(packer.compress(block))
+        block = payload.read(CHUNK_BYTES)
+    data.write(packer.flush())
+    data.seek(0)
+    return flags, data, length
+
+
+def pack(payload, codec=None, level=None, timer=None):
+    """
+    Compressing (optional) and framing a message
+    (the length of the message, the length of the compressed message and the ratio are added to the record of the timer)
+    :param payload: message (bytes-like object or binary file opened for reading)
+    :param codec: one of CODECS or None
+    :param level: compression level (optional)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :return: length of the framed message, generator of chunks of bytes (see payload_chunks)
+    """
+    timer = timer or metrics.StageTimer('embed')
+    if codec is None:
+        with timer.stage(metrics.PACK):
+            return payload_chunks(payload)
+    with timer.stage(metrics.COMPRESS):
+        flags, data, length = compress(payload, codec, level)
+    with timer.stage(metrics.PACK):
+        total, chunks = payload_chunks(data, flags)
+    compressed = total - HEADER.size
+    timer.info.update(codec=codec, payload=length, compressed=compressed, ratio=length / compressed)
+    if isinstance(data, bytes):
+        return total, chunks
+
+    def generate():
+        with data:
+            yield from chunks
+
+    return total, generate()
+
+
+def unframe(chunks, out=None, timer=None, legacy=False):
+    """
+    Removing the header of a message and decompressing it
+    (a message without a header is a text message of an older version: only its ASCII characters are kept, as before)
+    :param chunks: chunks of bytes of the message with its header
+    :param out: binary file for writing the message chunk by chunk (optional)
+    :param timer: metrics.StageTimer for the timings of the stages (optional, decompression is part of the extraction)
+    :param legacy: the key is older than the header (see read_key), a message without a header is accepted
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    timer = timer or metrics.StageTimer('extract')
+    target = io.BytesIO() if out is None else out
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    remaining = None
+    unpacker = None
+    if len(first) >= HEADER.size:
+        magic, flags, length = HEADER.unpack_from(first)
+        if magic == MAGIC:
+            first = first[HEADER.size:]
+            remaining = length
+            if flags:
+                unpacker = decompressor(flags)
+    if remaining is None and not legacy:
+        # new keys always embed a header: the container or the key is wrong
+        raise ValueError('No message header: the container does not match the key')
+    read = 0
+    written = 0
+    for data in itertools.chain((first,), chunks):
+        if remaining is None:
+            data = bytes(data).translate(None, NOT_ASCII)
+        else:
+            data = data[:remaining - read]
+        read += len(data)
+        if unpacker is not None:
+            with timer.stage(metrics.DECOMPRESS):
+                data = unpacker.decompress(data)
+        target.write(data)
+        written += len(data)
+        if remaining is not None and read >= remaining:
+            break
+    if unpacker is not None:
+        if not unpacker.eof:
+            raise ValueError('The compressed message is incomplete')
+        timer.info.update(codec=CODECS[flags - 1], payload=written, compressed=read, ratio=written / read if read else None)
+    return target.getvalue() if out is None else written
+
+
+# ----------------------Embedding/extraction--------------------
+
+BAND_ROWS = 256  # rows of the picture in memory at once (streaming mode)
+
+# channels of the modes of containers (8 bits per sample, 16 bits for I;16 grayscale)
+CHANNELS = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4, 'I;16': 1, 'I;16L': 1, 'I;16B': 1}
+
+
+def chunk_ranges(count, progress=None, size=CHUNK):
+    """
+    Splitting the selected pixels into chunks and reporting every processed chunk
+    :param count: number of pixels
+    :param progress: progress.Progress (optional, progress.Cancelled is raised before a chunk if the job was cancelled)
+    :param size: number of pixels in a chunk
+    :return: generator of (first, last + 1)
+    """
+    if progress is not None:
+        progress.start(count)
+    for first in range(0, count, size):
+        if progress is not None:
+            progress.check()
+        stop = min(first + size, count)
+        yield first, stop
+        if progress is not None:
+            progress.add(stop - first)
+
+
+def write_symbols(pixels, flat, symbols, depth=DEFAULT_DEPTH):
+    """
+    Writing values into the depth least significant bits of the selected pixels
+    :param pixels: array (rows x width x channels, 8 or 16 bits per sample), can be a view
+    :param flat: positions of the pixels in the array (row * width + column)
+    :param symbols: values of depth bits, one per channel (the last pixel can get fewer)
+    :param depth: bits per channel
+    """
+    w, channels = pixels.shape[1], pixels.shape[2]
+    full = len(symbols) // channels
+    keep = np.iinfo(pixels.dtype).max ^ ((1 << depth) - 1)
+
+    # a pixel can be selected twice, the later write wins (as in the per-pixel loop)
+    unique, rev_i = np.unique(flat[:full][::-1], return_index=True)
+    values = symbols[:channels * full].reshape(full, channels)[full - 1 - rev_i]
+    y, x = np.divmod(unique, w)
+    pixels[y, x] = (pixels[y, x] & keep) | values
+
+    # the last block may hold fewer values than channels
+    rest = symbols[channels * full:]
+    if len(rest):
+        y, x = divmod(int(flat[full]), w)
+        pixels[y, x, :len(rest)] = (pixels[y, x, :len(rest)] & keep) | rest
+
+
+def read_symbols(pixels, flat, depth=DEFAULT_DEPTH):
+    """
+    Reading the depth least significant bits of every channel of the selected pixels
+    :param pixels: array (rows x width x channels, 8 or 16 bits per sample), can be a view
+    :param flat: positions of the pixels in the array (row * width + column)
+    :param depth: bits per channel
+    :return: array of values (pixels x channels, numpy.uint8)
+    """
+    y, x = np.divmod(np.asarray(flat), pixels.shape[1])
+    return (pixels[y, x] & ((1 << depth) - 1)).astype(np.uint8)
+
+
+def to_bytes(values, depth=DEFAULT_DEPTH):
+    """
+    Packing values of depth bits into bytes (an incomplete last byte is dropped)
+    :param values: array of values
+    :param depth: bits per value
+    :return: message (bytes)
+    """
+    shifts = np.arange(depth - 1, -1, -1, dtype=np.uint8)
+    bits = ((values.reshape(-1, 1) >> shifts) & 1).reshape(-1)
+    return np.packbits(bits[:len(bits) // 8 * 8]).tobytes()
+
+
+def write_stream(pixels, flat, chunks, progress=None, depth=DEFAULT_DEPTH):
+    """
+    Writing a message chunk by chunk (chunks are written in order, so the later write still wins)
+    :param pixels: array (rows x width x channels), can be a view
+    :param flat: positions of the pixels in the array (row * width + column), an array or LazyPositions (sliced chunk by chunk)
+    :param chunks: chunks of bytes (see payload_chunks), bytes after the last pixel are dropped
+    :param progress: progress.Progress (optional)
+    :param depth: bits per channel
+    """
+    channels = pixels.shape[2]
+    unit = channels * depth  # bytes filling a whole number of pixels (eight)
+    if progress is not None:
+        progress.start(len(flat))
+    first = 0
+    rest = b''
+    for data in itertools.chain(chunks, [None]):
+        if first >= len(flat):
+            break
+        if progress is not None:
+            progress.check()
+        if data is None:
+            # the last bytes, the last pixel can get fewer values than channels
+            data = rest
+        else:
+            # bytes that do not fill a whole pixel go with the next chunk
+            if rest:
+                data = bytes(rest) + bytes(data)
+            cut = len(data) - len(data) % unit
+            data, rest = data[:cut], data[cut:]
+        symbols = to_symbols(data, depth)[:channels * (len(flat) - first)]
+        count = symbol_pixels(symbols, channels)
+        write_symbols(pixels, np.asarray(flat[first:first + count]), symbols, depth)
+        first += count
+        if progress is not None:
+            progress.add(count)
+
+
+def read_stream(pixels, flat, progress=None, depth=DEFAULT_DEPTH):
+    """
+    Reading a message chunk by chunk
+    :param pixels: array (rows x width x channels), can be a view
+    :param flat: positions of the pixels in the array (row * width + column), an array or LazyPositions (sliced chunk by chunk)
+    :param progress: progress.Progress (optional)
+    :param depth: bits per channel
+    :return: generator of chunks of bytes (an incomplete last byte is dropped)
+    """
+    for first, stop in chunk_ranges(len(flat), progress):
+        yield to_bytes(read_symbols(pixels, flat[first:stop], depth), depth)
+
+
+def carrier_mode(image):
+    """
+    Mode of an image as a container (images of other modes than CHANNELS are converted)
+    :param image: image (can be opened lazily, only the mode and the info are read)
+    :return: one of CHANNELS
+    """
+    if image.mode in CHANNELS:
+        return image.mode
+    if image.mode == 'PA' or (image.mode == 'P' and 'transparency' in image.info):
+        return 'RGBA'
+    return 'RGB'
+
+
+def carrier_image(image):
+    """
+    Converting an image-container of a mode without native support (palette, 1-bit, CMYK...)
+    :param image: image
+    :return: image of one of the modes of CHANNELS
+    """
+    mode = carrier_mode(image)
+    return image if mode == image.mode else image.convert(mode)
+
+
+def capacity(width, height, mode='RGB', depth=DEFAULT_DEPTH):
+    """
+    Maximum length of a message in a container
+    :param width: picture width
+    :param height: picture height
+    :param mode: mode of the container (one of CHANNELS)
+    :param depth: bits per channel
+    :return: number of bytes (header of the message excluded)
+    """
+    return max(0, width * height * CHANNELS[mode] * depth // 8 - HEADER.size)
+
+
+def check_capacity(length, available):
+    """
+    Checking that a message fits into a container
+    :param length: length of the message in bytes (header excluded)
+    :param available: capacity of the container (see capacity)
+    """
+    if length > available:
+        raise ValueError('The message ({} bytes) does not fit into the container ({} bytes at most)'.format(length, available))
+
+
+def image_capacity(source, depth=DEFAULT_DEPTH):
+    """
+    Maximum length of a message in an image file, only the header of the file is read (the pixels are not decoded)
+    :param source: path to the image or binary file
+    :param depth: bits per channel
+    :return: number of bytes (header of the message excluded)
+    """
+    with Image.open(source) as image:
+        return capacity(image.size[0], image.size[1], carrier_mode(image), depth)
+
+
+def preflight(container, payload, depth=DEFAULT_DEPTH, codec=None):
+    """
+    Checking that a message fits into a container before any heavy work (decoding, compression, generation of pixels)
+    A message to be compressed is not rejected here: its length is known after compression (checked by the embedding)
+    :param container: path to the image-container
+    :param payload: message (bytes-like object, binary file or path to a file)
+    :param depth: bits per channel
+    :param codec: compression of the message (one of CODECS, optional)
+    :return: capacity of the container in bytes, length of the message in bytes
+    """
+    available = image_capacity(container, depth)
+    length = payload_length(payload)
+    if codec is None:
+        check_capacity(length, available)
+    return available, length
+
+
+def container_suffix(mode):
+    """
+    Format of a filled container: 24-bit BMP (also read without decoding, see extract_mmap) for RGB,
+    PNG for the other modes (BMP has no alpha channel and no 16-bit samples)
+    :param mode: mode of the container
+    :return: file extension
+    """
+    return '.bmp' if mode == 'RGB' else '.png'
+
+
+def image_array(image):
+    """
+    Pixels of an image as an array of rows x width x channels
+    :param image: image of one of the modes of CHANNELS
+    :return: array (copy, numpy.uint8 or numpy.uint16)
+    """
+    if image.mode not in CHANNELS:
+        raise ValueError('Unsupported image mode: {}'.format(image.mode))
+    pixels = np.array(image)
+    return pixels.reshape(pixels.shape[0], pixels.shape[1], CHANNELS[image.mode])
+
+
+def array_image(pixels):
+    """
+    Image from an array of rows x width x channels (the mode follows from the channels and the type of samples)
+    :param pixels: array
+    :return: image
+    """
+    return Image.fromarray(pixels[:, :, 0] if pixels.shape[2] == 1 else pixels)
+
+
+def embed_pixels(image, prng, chunks, progress=None, depth=DEFAULT_DEPTH):
+    """
+    Function for embedding a message in an image
+    :param image: image-container (one of the modes of CHANNELS)
+    :param prng: positions of pseudo-random pixels
+    :param chunks: message (chunks of bytes, see payload_chunks)
+    :param progress: progress.Progress (optional)
+    :param depth: bits per channel
+    :return: filled container
+    """
+    pixels = image_array(image)
+    write_stream(pixels, prng, chunks, progress, depth)
+    return array_image(pixels)
+
+
+def extract_pixels(image, prng, progress=None, out=None, timer=None, depth=DEFAULT_DEPTH, legacy=False):
+    """
+    Function for extracting a message from an image
+    :param image: filled container (one of the modes of CHANNELS)
+    :param prng: positions of pseudo-random pixels
+    :param progress: progress.Progress (optional)
+    :param out: binary file for writing the message chunk by chunk (optional)
+    :param timer: metrics.StageTimer for the timing of the decompression (optional)
+    :param depth: bits per channel
+    :param legacy: a message without a header is accepted (see read_key)
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    return unframe(read_stream(image_array(image), prng, progress, depth), out, timer, legacy)
+
+
+@contextmanager
+def removed_on_error(path):
+    """
+    Removing a partly written output file if the block fails or is cancelled
+    :param path: path to the file
+    """
+    try:
+        yield
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def bands(header, prng, band_rows):
+    """
+    Grouping pseudo-random pixels by bands of rows of a BMP file
+    :param header: BMP header
+    :param prng: positions of pseudo-random pixels
+    :param band_rows: number of rows in a band
+    :return: file rows of the pixels, columns of the pixels, list of (first row, number of rows, numbers of pixels in the band)
+    """
+    y, x = np.divmod(np.asarray(prng, dtype=np.int64), header.width)
+    rows = bmp.file_rows(header, y)
+    band = rows // band_rows
+    order = np.argsort(band, kind='stable')
+    count = (header.height + band_rows - 1) // band_rows
+    bounds = np.searchsorted(band[order], np.arange(count + 1))
+    result = []
+    for b in range(count):
+        first = b * band_rows
+        result.append((first, min(band_rows, header.height - first), order[bounds[b]:bounds[b + 1]]))
+    return rows, x, result
+
+
+def embed_stream(carrier, out, payload, mode=DEFAULT_MODE, band_rows=BAND_ROWS, timer=None, progress=None,
+                 codec=None, level=None, depth=DEFAULT_DEPTH):
+    """
+    Embedding a message in a BMP file band by band (only band_rows rows of the picture are in memory)
+    :param carrier: path to the image-container (uncompressed 24-bit BMP)
+    :param out: path to the filled container
+    :param payload: message (bytes-like object or binary file, the whole message is unpacked in memory)
+    :param mode: generator mode (one of EMBED_MODES)
+    :param band_rows: number of rows in a band
+    :param timer: metrics.StageTimer for the timings of the stages (optional, reading and writing of bands is part of 'embed')
+    :param progress: progress.Progress (optional, reported after every band)
+    :param codec: compression of the message (one of CODECS, optional)
+    :param level: compression level (optional)
+    :param depth: bits per channel (one of DEPTHS)
+    :return: (encrypted key, key for decrypting)
+    """
+    check_mode(mode)
+    timer = timer or metrics.StageTimer('embed')
+    with open(carrier, 'rb') as src:
+        # the output is created only when the carrier and the size of the message are checked
+        with timer.stage(metrics.OPEN):
+            header = bmp.read_header(src)
+        total, chunks = pack(payload, codec, level, timer)
+        check_capacity(total - HEADER.size, capacity(header.width, header.height, 'RGB', depth))
+        with timer.stage(metrics.PACK):
+            symbols = to_symbols(b''.join(chunks), depth)
+        with timer.stage(metrics.KEY):
+            seed, key = create_key(symbol_pixels(symbols), mode, depth)
+        with timer.stage(metrics.INDEX):
+            prng = positions(mode, seed, header.width, header.height, symbol_pixels(symbols))
+        with removed_on_error(out), open(out, 'wb') as dst, timer.stage(metrics.EMBED):
+            symbols = symbols[:3 * len(prng)]
+            full = len(symbols) // 3
+            blocks = symbols[:3 * full].reshape(full, 3)
+            rows, x, groups = bands(header, prng, band_rows)
+            if progress is not None:
+                progress.start(len(prng))
+            src.seek(0)
+            dst.write(src.read(header.offset))
+            for first, count, idx in groups:
+                if progress is not None:
+                    progress.check()
+                data = bmp.read_rows(src, header, first, count)
+                if len(idx):
+                    sub = blocks[idx[idx < full]].reshape(-1)
+                    if idx[-1] == full:
+                        sub = np.concatenate((sub, symbols[3 * full:]))
+                    write_symbols(bmp.pixels(data, header), (rows[idx] - first) * header.width + x[idx], sub, depth)
+                dst.write(data.tobytes())
+                if progress is not None:
+                    progress.add(len(idx))
+            src.seek(header.offset + header.height * header.stride)
+            dst.write(src.read())
+    return key
+
+
+def extract_stream(container, key, band_rows=BAND_ROWS, timer=None, progress=None, out=None):
+    """
+    Extracting a message from a BMP file band by band (bands without selected pixels are not read)
+    :param container: path to the filled container (uncompressed 24-bit BMP)
+    :param key: (encrypted key, key for decrypting)
+    :param band_rows: number of rows in a band
+    :param timer: metrics.StageTimer for the timings of the stages (optional, reading of bands is part of 'extract')
+    :param progress: progress.Progress (optional, reported after every band)
+    :param out: binary file for writing the message (optional)
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    timer = timer or metrics.StageTimer('extract')
+    with timer.stage(metrics.KEY):
+        seed, number, mode, depth, legacy = read_key(key)
+    with open(container, 'rb') as f:
+        with timer.stage(metrics.OPEN):
+            header = bmp.read_header(f)
+        with timer.stage(metrics.INDEX):
+            prng = positions(mode, seed, header.width, header.height, number)
+        with timer.stage(metrics.EXTRACT):
+            values = np.empty((len(prng), 3), dtype=np.uint8)
+            rows, x, groups = bands(header, prng, band_rows)
+            if progress is not None:
+                progress.start(len(prng))
+            for first, count, idx in groups:
+                if len(idx):
+                    if progress is not None:
+                        progress.check()
+                    data = bmp.read_rows(f, header, first, count)
+                    values[idx] = read_symbols(bmp.pixels(data, header), (rows[idx] - first) * header.width + x[idx], depth)
+                    if progress is not None:
+                        progress.add(len(idx))
+            return unframe([to_bytes(values, depth)], out, timer, legacy)
+
+
+def file_positions(header, prng):
+    """
+    Positions of the selected pixels in the rows of a BMP file, converted slice by slice as the chunks need them
+    :param header: bmp.Header
+    :param prng: positions of pseudo-random pixels (array or LazyPositions)
+    :return: LazyPositions
+    """
+    return LazyPositions(lambda first, count: bmp.file_positions(header, prng[first:first + count]), len(prng))
+
+
+def embed_mmap_pixels(carrier, out, prng, chunks, progress=None, depth=DEFAULT_DEPTH):
+    """
+    Embedding a message in a copy of a BMP file through a memory map (only the touched pages are written)
+    :param carrier: path to the image-container (uncompressed 24-bit BMP)
+    :param out: path to the filled container
+    :param prng: positions of pseudo-random pixels
+    :param chunks: message (chunks of bytes, see payload_chunks)
+    :param progress: progress.Progress (optional)
+    :param depth: bits per channel
+    """
+    with removed_on_error(out):
+        shutil.copyfile(carrier, out)
+        with open(out, 'r+b') as f:
+            header = bmp.read_header(f)
+            flat = file_positions(header, prng)
+            with mmap.mmap(f.fileno(), 0) as mm:
+                rows = bmp.map_rows(mm, header)
+                try:
+                    write_stream(bmp.pixels(rows, header), flat, chunks, progress, depth)
+                except BaseException as e:
+                    released(e)
+                    raise
+                finally:
+                    del rows
+                mm.flush()
+
+
+def released(error):
+    """
+    Dropping the variables of the finished frames of an exception, so that their views of a memory map
+    do not keep the map from closing (it raises BufferError instead of the exception otherwise)
+    :param error: exception
+    """
+    traceback.clear_frames(error.__traceback__)
+
+
+def extract_mmap_pixels(container, prng, progress=None, out=None, timer=None, depth=DEFAULT_DEPTH, legacy=False):
+    """
+    Extracting a message from a BMP file through a memory map (only the pages with selected pixels are read)
+    :param container: path to the filled container (uncompressed 24-bit BMP)
+    :param prng: positions of pseudo-random pixels
+    :param progress: progress.Progress (optional)
+    :param out: binary file for writing the message chunk by chunk (optional)
+    :param timer: metrics.StageTimer for the timing of the decompression (optional)
+    :param depth: bits per channel
+    :param legacy: a message without a header is accepted (see read_key)
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    with open(container, 'rb') as f:
+        header = bmp.read_header(f)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            rows = bmp.map_rows(mm, header)
+            stream = read_stream(bmp.pixels(rows, header), file_positions(header, prng), progress, depth)
+            del rows
+            try:
+                return unframe(stream, out, timer, legacy)
+            except BaseException as e:
+                released(e)
+                raise
+            finally:
+                # the generator holds a view of the map until it is closed
+                stream.close()
+
+
+def bmp_size(path):
+    """
+    Size of the picture if the file is an uncompressed 24-bit BMP
+    :param path: file path
+    :return: (width, height) or None
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = bmp.read_header(f)
+    except (OSError, ValueError):
+        return None
+    return header.width, header.height
+
+
+# ----------------------Visualization--------------------------
+
+def lsb_lut(depth=DEFAULT_DEPTH, bits=8):
+    """
+    Lookup table scaling the least significant bits of a sample to 0...255 (0, 85, 170, 255 for two bits)
+    :param depth: number of least significant bits
+    :param bits: bits per sample (8 or 16)
+    :return: array of 2 ** bits values (numpy.uint8)
+    """
+    mask = (1 << depth) - 1
+    return ((np.arange(1 << bits) & mask) * 255 // mask).astype(np.uint8)
+
+
+def lsb_image(img, depth=DEFAULT_DEPTH):
+    """
+    Demonstration of least significant bits of pixels, all colour channels in one picture
+    :param img: image (a mode without native support is converted, see carrier_image)
+    :param depth: number of least significant bits of every channel
+    :return: new image (RGB for colour images, L for grayscale ones), the alpha channel is shown by lsb_planes
+    """
+    img = carrier_image(img)
+    if img.mode in ('RGB', 'RGBA'):
+        return img.convert('RGB').point(lsb_lut(depth).tolist() * 3)
+    if img.mode in ('L', 'LA'):
+        return img.getchannel('L').point(lsb_lut(depth).tolist())
+    # 16-bit samples: NumPy lookup (Image.point maps only 8-bit bands to 8-bit bands)
+    return Image.fromarray(lsb_lut(depth, 16)[image_array(img)[:, :, 0]])
+
+
+def lsb_planes(img, depth=DEFAULT_DEPTH):
+    """
+    Demonstration of least significant bits of pixels, one picture per channel
+    :param img: image (a mode without native support is converted, see carrier_image)
+    :param depth: number of least significant bits of every channel
+    :return: list of (name of the channel, image of mode L)
+    """
+    img = carrier_image(img)
+    if img.mode.startswith('I;16'):
+        return [('I', lsb_image(img, depth))]
+    lut = lsb_lut(depth).tolist()
+    return [(name, band.point(lut)) for name, band in zip(img.getbands(), img.split())]
+
+
+DENSITY_SIDE = 1024  # longest side of a density map
+# colours of a density map from unused to fully used cells (white, yellow, red, black)
+DENSITY_COLOURS = np.array([[255, 255, 255], [255, 230, 0], [220, 0, 0], [0, 0, 0]], dtype=np.float64)
+
+
+def used_pixels(size, prng):
+    """
+    Map of the pixel distribution
+    :param size: (width, height) of the container
+    :param prng: positions of pseudo-random pixels
+    :return: image of mode L (used pixels are black)
+    """
+    w, h = size
+    mask = np.full(w * h, 255, dtype=np.uint8)
+    mask[np.asarray(prng, dtype=np.int64)] = 0
+    return Image.fromarray(mask.reshape(h, w))
+
+
+def density_lut():
+    """
+    Colours of a density map
+    :return: array of 256 colours (numpy.uint8, 256 x 3), from unused to fully used cells
+    """
+    stops = np.linspace(0, 255, len(DENSITY_COLOURS))
+    levels = np.arange(256)
+    return np.stack([np.interp(levels, stops, DENSITY_COLOURS[:, c]) for c in range(3)], axis=1).astype(np.uint8)
+
+
+def used_density(size, prng, side=DENSITY_SIDE):
+    """
+    Heatmap of the pixel distribution at a reduced resolution (a cell of the map covers factor x factor pixels)
+    :param size: (width, height) of the container
+    :param prng: positions of pseudo-random pixels
+    :param side: longest side of the map
+    :return: image of mode RGB (the share of used pixels of a cell, see DENSITY_COLOURS)
+    """
+    w, h = size
+    factor = max(1, -(-max(w, h) // side))
+    mw, mh = -(-w // factor), -(-h // factor)
+    y, x = np.divmod(np.asarray(prng, dtype=np.int64), w)
+    counts = np.bincount((y // factor) * mw + x // factor, minlength=mw * mh)
+    # pixels of every cell (the cells of the last row and column can be smaller)
+    area = np.outer(np.minimum(factor, h - np.arange(mh) * factor), np.minimum(factor, w - np.arange(mw) * factor))
+    level = np.minimum(255, counts.reshape(mh, mw) * 255 // area).astype(np.uint8)
+    return Image.fromarray(density_lut()[level])
+
+
+# ---------------------------API---------------------------------
+
+def open_image(source):
+    """
+    Getting an image from any supported source
+    :param source: PIL image, NumPy array (height x width x channels), encoded file as bytes or path to a file
+    :return: PIL image
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, np.ndarray):
+        return Image.fromarray(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (str, os.PathLike)):
+        return Image.open(source)
+    raise TypeError('Unsupported image source: {}'.format(type(source).__name__))
+
+
+def embed(image, payload, mode=DEFAULT_MODE, timer=None, progress=None, codec=None, level=None, depth=DEFAULT_DEPTH):
+    """
+    Embedding a message in an image
+    :param image: image-container (see open_image, an image of another mode than CHANNELS is converted)
+    :param payload: message (bytes-like object or binary file, read chunk by chunk while embedding)
+    :param mode: generator mode (one of EMBED_MODES)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :param progress: progress.Progress (optional)
+    :param codec: compression of the message (one of CODECS, optional)
+    :param level: compression level (optional)
+    :param depth: bits per channel (one of DEPTHS)
+    :return: filled container (saved losslessly, see container_suffix), (encrypted key, key for decrypting)
+    """
+    check_mode(mode)
+    timer = timer or metrics.StageTimer('embed')
+    with timer.stage(metrics.OPEN):
+        image = open_image(image)
+        image.load()
+        image = carrier_image(image)
+    image, key, prng = embed_image(image, payload, mode, timer, progress, codec, level, depth)
+    return image, key
+
+
+def embed_image(image, payload, mode=DEFAULT_MODE, timer=None, progress=None, codec=None, level=None, depth=DEFAULT_DEPTH):
+    """
+    Embedding a message in a decoded image (the stages of embed after opening the container)
+    :param image: image-container of one of the modes of CHANNELS (see carrier_image)
+    :param payload: message (bytes-like object or binary file, read chunk by chunk while embedding)
+    :param mode: generator mode (one of EMBED_MODES)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :param progress: progress.Progress (optional)
+    :param codec: compression of the message (one of CODECS, optional)
+    :param level: compression level (optional)
+    :param depth: bits per channel (one of DEPTHS)
+    :return: filled container, (encrypted key, key for decrypting), positions of the used pixels
+    """
+    check_mode(mode)
+    timer = timer or metrics.StageTimer('embed')
+    total, chunks = pack(payload, codec, level, timer)
+    check_capacity(total - HEADER.size, capacity(image.size[0], image.size[1], image.mode, depth))
+    number = byte_pixels(total, depth, CHANNELS[image.mode])
+    with timer.stage(metrics.KEY):
+        seed, key = create_key(number, mode, depth)
+    with timer.stage(metrics.INDEX):
+        prng = positions(mode, seed, image.size[0], image.size[1], number)
+    with timer.stage(metrics.EMBED):
+        image = embed_pixels(image, prng, chunks, progress, depth)
+    return image, key, prng
+
+
+def extract(image, key, timer=None, progress=None, out=None):
+    """
+    Extracting a message from an image
+    :param image: filled container (see open_image)
+    :param key: (encrypted key, key for decrypting)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :param progress: progress.Progress (optional)
+    :param out: binary file for writing the message chunk by chunk (optional)
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    timer = timer or metrics.StageTimer('extract')
+    with timer.stage(metrics.OPEN):
+        image = open_image(image)
+        image.load()
+    with timer.stage(metrics.KEY):
+        seed, number, mode, depth, legacy = read_key(key)
+    with timer.stage(metrics.INDEX):
+        prng = positions(mode, seed, image.size[0], image.size[1], number)
+    with timer.stage(metrics.EXTRACT):
+        return extract_pixels(image, prng, progress, out, timer, depth, legacy)
+
+
+def embed_mmap(carrier, out, payload, mode=DEFAULT_MODE, timer=None, progress=None, codec=None, level=None,
+               depth=DEFAULT_DEPTH):
+    """
+    Embedding a message in a copy of a BMP file without decoding it (see embed_mmap_pixels)
+    :param carrier: path to the image-container (uncompressed 24-bit BMP)
+    :param out: path to the filled container
+    :param payload: message (bytes-like object or binary file, read chunk by chunk while embedding)
+    :param mode: generator mode (one of EMBED_MODES)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :param progress: progress.Progress (optional)
+    :param codec: compression of the message (one of CODECS, optional)
+    :param level: compression level (optional)
+    :param depth: bits per channel (one of DEPTHS)
+    :return: (encrypted key, key for decrypting)
+    """
+    check_mode(mode)
+    timer = timer or metrics.StageTimer('embed')
+    with timer.stage(metrics.OPEN):
+        size = bmp_size(carrier)
+    if size is None:
+        raise ValueError('Only uncompressed 24-bit BMP files are supported')
+    total, chunks = pack(payload, codec, level, timer)
+    check_capacity(total - HEADER.size, capacity(size[0], size[1], 'RGB', depth))
+    number = byte_pixels(total, depth)
+    with timer.stage(metrics.KEY):
+        seed, key = create_key(number, mode, depth)
+    with timer.stage(metrics.INDEX):
+        prng = positions(mode, seed, size[0], size[1], number)
+    with timer.stage(metrics.EMBED):
+        embed_mmap_pixels(carrier, out, prng, chunks, progress, depth)
+    return key
+
+
+def extract_mmap(container, key, timer=None, progress=None, out=None):
+    """
+    Extracting a message from a BMP file without decoding it (see extract_mmap_pixels)
+    :param container: path to the filled container (uncompressed 24-bit BMP)
+    :param key: (encrypted key, key for decrypting)
+    :param timer: metrics.StageTimer for the timings of the stages (optional)
+    :param progress: progress.Progress (optional)
+    :param out: binary file for writing the message chunk by chunk (optional)
+    :return: message (bytes) or, if out is given, number of written bytes
+    """
+    timer = timer or metrics.StageTimer('extract')
+    with timer.stage(metrics.OPEN):
+        size = bmp_size(container)
+    if size is None:
+        raise ValueError('Only uncompressed 24-bit BMP files are supported')
+    with timer.stage(metrics.KEY):
+        seed, number, mode, depth, legacy = read_key(key)
+    with timer.stage(metrics.INDEX):
+        prng = positions(mode, seed, size[0], size[1], number)
+    with timer.stage(metrics.EXTRACT):
+        return extract_mmap_pixels(container, prng, progress, out, timer, depth, legacy)
@@ -0,0 +1,95 @@
+"""
+Pool of worker threads of the application
+Every submitted call returns a Job: a handle with cancel, progress and result
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import progress
+
+
+class Job:
+    """
+    Handle of a call running on the pool
+    """
+    def __init__(self, future, token):
+        """
+        :param future: concurrent.futures.Future of the call
+        :param token: progress.Progress of the call (also its cancellation token)
+        """
+        self.future = future
+        self.token = token
+
+    def cancel(self):
+        """
+        Cancelling the job: a waiting job is not started, a running job stops at the next chunk
+        """
+        self.token.cancel()
+        self.future.cancel()
+
+    def cancelled(self):
+        """
+        :return: True if the job was cancelled
+        """
+        return self.token.cancelled()
+
+    def done(self):
+        """
+        :return: True if the job finished, failed or was cancelled
+        """
+        return self.future.done()
+
+    def percent(self):
+        """
+        Progress of the job
+        :return: 0...100
+        """
+        return self.token.percent()
+
+    def add_done_callback(self, fn):
+        """
+        Calling fn(job) when the job is finished (on the thread that finished it, at once if it is already finished)
+        :param fn: function
+        """
+        self.future.add_done_callback(lambda future: fn(self))
+
+    def result(self, timeout=None):
+        """
+        Waiting for the result of the job
+        :param timeout: seconds (None - no limit)
+        :return: result of the call (raises its exception, progress.Cancelled or concurrent.futures.CancelledError)
+        """
+        return self.future.result(timeout)
+
+
+class Runner:
+    """
+    Pool of worker threads that are reused between jobs
+    """
+    def __init__(self, workers=None):
+        """
+        :param workers: number of threads (None - default of ThreadPoolExecutor)
+        """
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stego')
+        self.jobs = set()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Running a call on the pool
+        :param func: function, gets the token of the job as keyword argument token
+        :param args: arguments
+        :param kwargs: keyword arguments
+        :return: Job
+        """
+        token = progress.Progress()
+        job = Job(self.pool.submit(func, *args, token=token, **kwargs), token)
+        self.jobs.add(job)
+        job.add_done_callback(self.jobs.discard)
+        return job
+
+    def shutdown(self):
+        """
+        Cancelling all jobs and stopping the pool without waiting
+        """
+        for job in list(self.jobs):
+            job.cancel()
+        self.pool.shutdown(wait=False)
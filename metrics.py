@@ -0,0 +1,72 @@
+"""
+Per-stage timing of embedding/extraction jobs
+Every finished job gives one record: {"job": ..., "status": ..., "total": ..., "stages": {stage: seconds}, ...}
+which is written to the log 'stego.metrics' as one JSON line
+(a compressed message adds "codec", "payload" and "compressed" (bytes) and "ratio" (payload / compressed))
+"""
+import json
+import logging
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger('stego.metrics')
+
+# stages of a job in the order they run
+OPEN = 'open'            # image open/convert (and decoding)
+COMPRESS = 'compress'    # compression of the message (optional)
+PACK = 'pack'            # bit packing of the message
+KEY = 'key'              # key encryption/decryption
+INDEX = 'index'          # generation of pseudo-random pixels
+EMBED = 'embed'          # pixel embedding
+EXTRACT = 'extract'      # pixel extraction
+DECOMPRESS = 'decompress'  # decompression of the message (part of extract, the message is decompressed while it is read)
+SAVE = 'save'            # image save
+KEY_WRITE = 'key_write'  # key files write
+
+
+class StageTimer:
+    """
+    Monotonic timings of the stages of one job
+    """
+    def __init__(self, job, **info):
+        """
+        :param job: 'embed' or 'extract'
+        :param info: other fields of the record (file names, sizes...)
+        """
+        self.job = job
+        self.info = info
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Timing a stage (the time of repeated stages is summed)
+        :param name: name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self, status='ok'):
+        """
+        Record of the job
+        :param status: 'ok' or 'error'
+        :return: dict
+        """
+        record = {'job': self.job, 'status': status, 'total': time.perf_counter() - self.start, 'stages': dict(self.stages)}
+        record.update(self.info)
+        return record
+
+    def log(self, status='ok'):
+        """
+        Writing the record of the job to the log as a JSON line
+        :param status: 'ok' or 'error'
+        :return: record (dict)
+        """
+        record = self.record(status)
+        logger.info(json.dumps(record))
+        return record
@@ -0,0 +1,59 @@
+"""
+Pictures of the preview panel of the GUI
+A picture is kept as a pyramid of downscaled copies (each level is half the size of the previous one),
+the levels are built from the image in memory when a zoom first needs them, so a large picture
+is never encoded to a file and a small zoom never converts the full-size picture
+"""
+import numpy as np
+
+from PIL import Image
+
+MODES = ('L', 'RGB', 'RGBA')  # modes of the levels (8 bits per channel)
+
+
+def display_image(image):
+    """
+    8-bit copy of an image for the screen
+    :param image: image of any mode
+    :return: image of one of MODES (the image itself if it is already one of them)
+    """
+    if image.mode in MODES:
+        return image
+    if image.mode.startswith('I;16'):
+        return Image.fromarray((np.array(image) >> 8).astype(np.uint8))
+    return image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+
+class Pyramid:
+    """
+    Downscaled copies of a picture built on demand
+    """
+    def __init__(self, image):
+        """
+        :param image: the full-size picture
+        """
+        self.levels = {1: display_image(image)}  # reduction factor -> image
+
+    def size(self):
+        """
+        :return: (width, height) of the full-size picture
+        """
+        return self.levels[1].size
+
+    def level(self, scale):
+        """
+        The smallest level that is not smaller than the picture at a zoom
+        :param scale: zoom (1 is the full size)
+        :return: reduction factor (a power of 2), image of the level
+        """
+        factor = 1
+        while factor * 2 * scale <= 1 and min(self.size()) >= factor * 2:
+            factor *= 2
+        # every level is the previous one averaged over 2 x 2 pixels
+        done = factor
+        while done not in self.levels:
+            done //= 2
+        while done < factor:
+            self.levels[done * 2] = self.levels[done].reduce(2)
+            done *= 2
+        return factor, self.levels[factor]
@@ -0,0 +1,71 @@
+"""
+Progress of a job shared between the thread that runs it and the GUI thread
+The engine adds the number of processed pixels after every chunk, the GUI reads the counter by a timer.
+The same object is the cancellation token of the job: the engine checks it between chunks
+"""
+import threading
+
+INTERVAL = 50  # ms between two readings of the counter by the GUI (20 Hz)
+
+
+class Cancelled(Exception):
+    """
+    The job was cancelled
+    """
+
+
+class Progress:
+    """
+    Thread-safe counter of processed pixels and cancellation token
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.total = 0
+        self.count = 0
+
+    def start(self, total):
+        """
+        Starting a new job
+        :param total: number of pixels of the job
+        """
+        with self.lock:
+            self.total = total
+            self.count = 0
+
+    def add(self, count):
+        """
+        Adding processed pixels (called by the engine after every chunk)
+        :param count: number of pixels in the chunk
+        """
+        with self.lock:
+            self.count += count
+
+    def percent(self):
+        """
+        Progress of the job
+        :return: 0...100
+        """
+        with self.lock:
+            if not self.total:
+                return 100 if self.count else 0
+            return min(100, self.count * 100 // self.total)
+
+    def cancel(self):
+        """
+        Asking the job to stop at the next check
+        """
+        self.stop.set()
+
+    def cancelled(self):
+        """
+        :return: True if the job was asked to stop
+        """
+        return self.stop.is_set()
+
+    def check(self):
+        """
+        Stopping the job if it was cancelled (called by the engine between chunks)
+        """
+        if self.stop.is_set():
+            raise Cancelled()
@@ -0,0 +1,12 @@
+"""
+Resources embedded in the application (no files or network access at startup)
+"""
+
+# application icon (PNG 64x64, base64)
+ICON = (
+    b'iVBORw0KGgoAAAANSUhEUgAAAEAAAABACAYAAACqaXHeAAABH0lEQVR42u2bMRLCIBBFA+NZrCwtU+dMVhZWnil1SksrL6NtnOAS'
+    b'oovD7qMFMvNfYN/ADF1H891CyeD9cHq2EOoxXsNPAbQSfAuIYDF4CYhoPXwuS7QePpcpSAOP/bCYcJvGr/rul2nRdzj3avNy2yF6'
+    b'12C0vvRzW4EV4Onvp7IGjwDmxdD9FthJnRoarK3PIgu41yAAAOD4QgQNosE6Gvz3aZAaAAAAAAANosGVGpTUo6Gzrd9EgxRBAAAA'
+    b'DaLBRjSooUipjxoAAAAAAA2iwY0a1LikrH1SpAYAAAAAQINosPJpUEORXIpSBAGgC6DkmYkVA7xp0JMK5wDipw4P4akBKQCWV0Eq'
+    b'W1w70GJ4cQtYgiBl4eFkyQctPp2leW8voiTrsnUcF+wAAAAASUVORK5CYII='
+)
@@ -0,0 +1,262 @@
+"""
+Jobs of the Steganography application
+Every job owns its state (files, image, pixels, keys, timings), so several jobs can run at once
+on the pool of worker threads (see jobs.Runner): the job object is the function submitted to the pool
+
+    task = EmbedTask(carrier, message, out)
+    handle = runner.submit(task)
+
+Results are written to <out>/Steganography/<container name>/ (<container name> (2), (3)... if it already exists,
+so two jobs never write to the same directory), the pictures of a finished job are kept
+in task.previews for the preview panel of the GUI
+"""
+import os
+
+from PIL import Image
+
+import engine
+import metrics
+import progress
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# status of the job -> status of the metrics record
+RECORD_STATUS = {DONE: 'ok', FAILED: 'error', CANCELLED: 'cancelled'}
+
+
+class Task:
+    """
+    Base of embedding and extraction jobs
+    """
+    kind = None
+
+    def __init__(self, container, out, show_pix=False, density=False):
+        """
+        :param container: path to the image-container
+        :param out: directory to save the results
+        :param show_pix: show the pixel distribution when the job is done
+        :param density: show the pixel distribution as a heatmap at a reduced resolution (with show_pix)
+        """
+        self.container = container
+        self.out = out
+        self.show_pix = show_pix
+        self.density = density
+        self.status = QUEUED
+        self.error = None
+        self.handle = None  # jobs.Job of the running job
+        self.record = None  # metrics record of the finished job
+        self.timer = metrics.StageTimer(self.kind, container=container)
+        self.size = None
+        self.prng = None
+        self.path = None  # directory of the results (see out_dir)
+        self.previews = []  # (title, image) of the pictures of the finished job
+
+    def name(self):
+        """
+        :return: file name of the container
+        """
+        return os.path.basename(self.container)
+
+    def out_dir(self):
+        """
+        Directory of the results of the job, a new one for every job (created on the first call, jobs of the same container
+        or of containers with the same name get <container name> (2), (3)...)
+        :return: path
+        """
+        base = os.path.join(self.out, 'Steganography', os.path.splitext(self.name())[0])
+        number = 1
+        while self.path is None:
+            path = base if number == 1 else '{} ({})'.format(base, number)
+            try:
+                os.makedirs(path)
+                self.path = path
+            except FileExistsError:
+                number += 1
+        return self.path
+
+    def percent(self):
+        """
+        Progress of the job
+        :return: 0...100
+        """
+        if self.status == DONE:
+            return 100
+        if self.handle is None:
+            return 0
+        return self.handle.percent()
+
+    def describe(self):
+        """
+        Status of the job for the queue (with the compression ratio of the message if it was compressed)
+        :return: text
+        """
+        ratio = self.timer.info.get('ratio')
+        if self.status == DONE and ratio:
+            return '{} ({} {:.1f}x)'.format(self.status, self.timer.info['codec'], ratio)
+        return self.status
+
+    def active(self):
+        """
+        :return: True if the job is queued or running
+        """
+        return self.status in (QUEUED, RUNNING)
+
+    def run(self, token):
+        """
+        Stages of the job
+        :param token: progress.Progress of the job
+        """
+        raise NotImplementedError
+
+    def pictures(self):
+        """
+        Pictures of the results of the job (optional, made on the worker thread)
+        :return: list of (title, image)
+        """
+        if self.show_pix and self.density:
+            return [('Density of used pixels', engine.used_density(self.size, self.prng))]
+        if self.show_pix:
+            return [('Used pixels', engine.used_pixels(self.size, self.prng))]
+        return []
+
+    def finish(self, status):
+        """
+        Finishing the job: writing the timings to the log
+        :param status: DONE, FAILED or CANCELLED
+        """
+        self.status = status
+        self.record = self.timer.log(RECORD_STATUS[status])
+
+    def __call__(self, token=None):
+        """
+        Running the job (on a worker thread)
+        :param token: progress.Progress of the job (progress and cancellation)
+        :return: the job
+        """
+        self.status = RUNNING
+        try:
+            self.run(token)
+        except progress.Cancelled:
+            self.finish(CANCELLED)
+        except Exception as e:
+            self.error = '{}: {}'.format(type(e).__name__, e)
+            self.finish(FAILED)
+        else:
+            self.finish(DONE)
+            self.previews = self.pictures()
+        self.prng = None
+        return self
+
+
+class EmbedTask(Task):
+    """
+    Embedding a message in an image
+    """
+    kind = 'embed'
+
+    def __init__(self, container, message, out, show_image=False, show_bits=False, show_pix=False, codec=None, level=None,
+                 depth=engine.DEFAULT_DEPTH, show_planes=False, density=False):
+        """
+        :param container: path to the image-container
+        :param message: path to the message (any file, read chunk by chunk while embedding)
+        :param out: directory to save the filled container and the keys
+        :param show_image: show the filled container when the job is done
+        :param show_bits: show the least significant bits of the filled container when the job is done
+        :param show_pix: show the pixel distribution when the job is done
+        :param codec: compression of the message (one of engine.CODECS, optional)
+        :param level: compression level (optional)
+        :param depth: bits per channel (one of engine.DEPTHS)
+        :param show_planes: show the least significant bits of every channel in its own picture (with show_bits)
+        :param density: show the pixel distribution as a heatmap at a reduced resolution (with show_pix)
+        """
+        super().__init__(container, out, show_pix, density)
+        self.message = message
+        self.codec = codec
+        self.level = level
+        self.depth = depth
+        self.show_planes = show_planes
+        self.show_image = show_image
+        self.show_bits = show_bits
+        self.image = None
+
+    def run(self, token):
+        with self.timer.stage(metrics.OPEN):
+            # an oversized message is rejected before the container is decoded
+            engine.preflight(self.container, self.message, self.depth, self.codec)
+            with Image.open(self.container) as image:
+                image.load()
+            image = engine.carrier_image(image)
+        self.size = image.size
+        with open(self.message, 'rb') as message:
+            image, key, self.prng = engine.embed_image(image, message, engine.DEFAULT_MODE, self.timer, token, self.codec,
+                                                       self.level, self.depth)
+        out = self.out_dir()
+        with self.timer.stage(metrics.SAVE):
+            image.save(os.path.join(out, os.path.splitext(self.name())[0] + engine.container_suffix(image.mode)))
+        with self.timer.stage(metrics.KEY_WRITE):
+            with open(os.path.join(out, 'PublicKey.txt'), 'w') as f:
+                f.write(key[0])
+            with open(os.path.join(out, 'PrivateKey.txt'), 'w') as f:
+                f.write(key[1])
+        self.image = image
+
+    def pictures(self):
+        pictures = []
+        if self.show_image:
+            pictures.append(('Container', self.image))
+        if self.show_bits and self.show_planes:
+            pictures += [('Least significant bits ({})'.format(name), plane)
+                         for name, plane in engine.lsb_planes(self.image, self.depth)]
+        elif self.show_bits:
+            pictures.append(('Least significant bits', engine.lsb_image(self.image, self.depth)))
+        self.image = None
+        return pictures + super().pictures()
+
+
+class ExtractTask(Task):
+    """
+    Extracting a message from an image
+    """
+    kind = 'extract'
+
+    def __init__(self, container, public_key, private_key, out, show_pix=False, density=False):
+        """
+        :param container: path to the filled container
+        :param public_key: path to the public key
+        :param private_key: path to the private key
+        :param out: directory to save the message
+        :param show_pix: show the pixel distribution when the job is done
+        :param density: show the pixel distribution as a heatmap at a reduced resolution (with show_pix)
+        """
+        super().__init__(container, out, show_pix, density)
+        self.public_key = public_key
+        self.private_key = private_key
+
+    def run(self, token):
+        image = None
+        with self.timer.stage(metrics.OPEN):
+            with open(self.public_key) as f:
+                pub_key = f.read().strip()
+            with open(self.private_key) as f:
+                pri_key = f.read().strip()
+            self.size = engine.bmp_size(self.container)
+            if self.size is None:
+                with Image.open(self.container) as image:
+                    image.load()
+                self.size = image.size
+        with self.timer.stage(metrics.KEY):
+            seed, number, mode, depth, legacy = engine.read_key((pub_key, pri_key))
+        with self.timer.stage(metrics.INDEX):
+            self.prng = engine.positions(mode, seed, self.size[0], self.size[1], number)
+        # the message is written while it is extracted, chunk by chunk (a failed extraction leaves no file)
+        message = os.path.join(self.out_dir(), 'StegoText.txt')
+        with engine.removed_on_error(message), open(message, 'wb') as f:
+            with self.timer.stage(metrics.EXTRACT):
+                if image is None:
+                    engine.extract_mmap_pixels(self.container, self.prng, token, f, self.timer, depth, legacy)
+                else:
+                    engine.extract_pixels(image, self.prng, token, f, self.timer, depth, legacy)
@@ -0,0 +1,326 @@
+"""
+Round-trip tests of the headless engine (python -m pytest or python -m unittest test_engine)
+Every case embeds a message, extracts it with the key and compares the bytes
+"""
+import hashlib
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from PIL import Image
+from cryptography.fernet import Fernet
+
+import engine
+
+MESSAGE = bytes(range(256)) * 8 + b'\x00\xff' * 100  # every byte value, also zeros and 0xff at the end
+
+
+def carrier(width, height, mode='RGB', seed=0):
+    """
+    Creating a random image
+    :param width: picture width
+    :param height: picture height
+    :param mode: image mode (RGB, RGBA, L, LA or I;16)
+    :param seed: seed of the generator
+    :return: image
+    """
+    rng = np.random.default_rng(seed)
+    if mode == 'I;16':
+        return Image.fromarray(rng.integers(0, 1 << 16, (height, width), dtype=np.uint16))
+    shape = (height, width) if mode == 'L' else (height, width, engine.CHANNELS[mode])
+    return Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8), mode)
+
+
+def saved(image):
+    """
+    Saving a filled container the way the application does (see engine.container_suffix) and reading it back
+    :param image: filled container
+    :return: image read from the file
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, 'BMP' if engine.container_suffix(image.mode) == '.bmp' else 'PNG')
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def write_bmp(path, image, top_down=False):
+    """
+    Writing an uncompressed 24-bit BMP file (rows are bottom-up, or top-down with a negative height)
+    :param path: path to the file
+    :param image: RGB image
+    :param top_down: order of rows
+    """
+    width, height = image.size
+    stride = (width * 3 + 3) & ~3
+    rows = np.zeros((height, stride), dtype=np.uint8)
+    rows[:, :width * 3] = np.array(image)[:, :, ::-1].reshape(height, width * 3)
+    if not top_down:
+        rows = rows[::-1]
+    with open(path, 'wb') as f:
+        f.write(b'BM' + struct.pack('<IHHI', 54 + rows.size, 0, 0, 54))
+        f.write(struct.pack('<IiiHHIIiiII', 40, width, -height if top_down else height, 1, 24, 0, rows.size, 2835, 2835, 0, 0))
+        f.write(rows.tobytes())
+
+
+def legacy_key(seed, number, *fields):
+    """
+    Creating a key of the format of older versions (seed and number of pixels, optional mode and depth)
+    :param seed: seed of the generator
+    :param number: number of pixels
+    :param fields: mode, depth
+    :return: (encrypted key, key for decrypting)
+    """
+    just_1 = 7
+    just_2 = hashlib.sha256(str(just_1).encode('utf-8')).hexdigest()
+    text = ' '.join([str(just_1), str(seed), str(number), just_2] + [str(i) for i in fields])
+    c_key = Fernet.generate_key()
+    return Fernet(c_key).encrypt(text.encode('utf-8')).decode('utf-8'), c_key.decode('utf-8')
+
+
+class KeyTest(unittest.TestCase):
+    """
+    Keys of all formats
+    """
+    def test_four_fields(self):
+        # the first format: no mode (random.shuffle) and no depth (2 bits)
+        self.assertEqual(engine.read_key(legacy_key(5, 100)), (5, 100, engine.SHUFFLE, 2, True))
+
+    def test_five_fields(self):
+        self.assertEqual(engine.read_key(legacy_key(5, 100, engine.FEISTEL)), (5, 100, engine.FEISTEL, 2, True))
+
+    def test_new_key(self):
+        for mode in engine.EMBED_MODES:
+            for depth in engine.DEPTHS:
+                seed, key = engine.create_key(100, mode, depth)
+                self.assertEqual(engine.read_key(key), (seed, 100, mode, depth, False))
+
+    def test_shuffle_is_decode_only(self):
+        with self.assertRaises(ValueError):
+            engine.create_key(100, engine.SHUFFLE)
+        with self.assertRaises(ValueError):
+            engine.embed(carrier(40, 30), b'message', engine.SHUFFLE)
+
+    def test_invalid_key(self):
+        e_txt = legacy_key(5, 100)[0]
+        with self.assertRaises(Exception):
+            engine.read_key((e_txt, Fernet.generate_key().decode('utf-8')))
+        with self.assertRaises(ValueError):
+            engine.read_key(legacy_key(5, 100, 'unknown'))
+
+
+class LegacyTest(unittest.TestCase):
+    """
+    Containers of older versions: a text message without a header, a four-field key
+    """
+    def test_four_field_key(self):
+        text = b'An old message, written before the header was added'
+        image = carrier(100, 80, seed=1)
+        number = engine.byte_pixels(len(text))
+        prng = engine.positions(engine.SHUFFLE, 11, 100, 80, number)
+        filled = engine.embed_pixels(image, prng, [text])
+        self.assertEqual(engine.extract(saved(filled), legacy_key(11, number)), text)
+
+    def test_five_field_key(self):
+        # a mode but no depth: written before the header as well
+        text = b'A message of a sample key'
+        image = carrier(100, 80, seed=2)
+        number = engine.byte_pixels(len(text))
+        prng = engine.positions(engine.SAMPLE, 12, 100, 80, number)
+        filled = engine.embed_pixels(image, prng, [text])
+        self.assertEqual(engine.extract(saved(filled), legacy_key(12, number, engine.SAMPLE)), text)
+
+    def test_legacy_positions(self):
+        # the column-major mapping of the per-pixel loop of Stego.py
+        width, height = 7, 5
+        numbers = list(range(1, width * height))
+        expected = [(((i + height - 1) // height - 1), (height - 1, i % height)[bool(i % height)]) for i in numbers]
+        got = engine.legacy_positions(numbers, width, height)
+        self.assertEqual([(int(p) % width, int(p) // width) for p in got], expected)
+
+
+class ImageTest(unittest.TestCase):
+    """
+    Decoded containers: every depth and every mode
+    """
+    def round_trip(self, image, payload, **options):
+        filled, key = engine.embed(image, payload, **options)
+        return engine.extract(saved(filled), key)
+
+    def test_depths_and_modes(self):
+        for mode in ('RGB', 'RGBA', 'L', 'LA', 'I;16'):
+            for depth in engine.DEPTHS:
+                for generator in engine.EMBED_MODES:
+                    with self.subTest(mode=mode, depth=depth, generator=generator):
+                        image = carrier(160, 120, mode)
+                        self.assertEqual(self.round_trip(image, MESSAGE, mode=generator, depth=depth), MESSAGE)
+
+    def test_converted_modes(self):
+        palette = carrier(90, 70).convert('P')
+        transparent = palette.copy()
+        transparent.info['transparency'] = 0
+        for image, mode in ((palette, 'RGB'), (transparent, 'RGBA'), (carrier(90, 70).convert('CMYK'), 'RGB')):
+            with self.subTest(mode=image.mode):
+                filled, key = engine.embed(image, MESSAGE)
+                self.assertEqual(filled.mode, mode)
+                self.assertEqual(engine.extract(saved(filled), key), MESSAGE)
+
+    def test_only_selected_bits_change(self):
+        for depth in engine.DEPTHS:
+            image = carrier(160, 120)
+            filled, key = engine.embed(image, MESSAGE, depth=depth)
+            changed = np.array(image) ^ np.array(filled)
+            self.assertEqual(int(changed.max()) >> depth, 0)
+
+    def test_capacity(self):
+        for mode in ('RGB', 'RGBA', 'L'):
+            for depth in engine.DEPTHS:
+                with self.subTest(mode=mode, depth=depth):
+                    image = carrier(33, 21, mode)
+                    available = engine.capacity(33, 21, mode, depth)
+                    payload = os.urandom(available)
+                    self.assertEqual(self.round_trip(image, payload, depth=depth), payload)
+                    with self.assertRaises(ValueError):
+                        engine.embed(image, payload + b'!', depth=depth)
+
+    def test_wrong_container(self):
+        # a new key always embeds a header, its message is not taken from another container
+        first, key = engine.embed(carrier(100, 80, seed=1), MESSAGE)
+        second, other = engine.embed(carrier(100, 80, seed=2), MESSAGE)
+        with self.assertRaises(ValueError):
+            engine.extract(saved(second), key)
+        with self.assertRaises(ValueError):
+            engine.extract(carrier(100, 80, seed=1), key)
+
+    def test_empty_and_sources(self):
+        image = carrier(100, 80)
+        self.assertEqual(self.round_trip(image, b''), b'')
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        filled, key = engine.embed(buffer.getvalue(), io.BytesIO(MESSAGE))
+        out = io.BytesIO()
+        self.assertEqual(engine.extract(saved(filled), key, out=out), len(MESSAGE))
+        self.assertEqual(out.getvalue(), MESSAGE)
+
+    def test_large_message(self):
+        # several chunks (engine.CHUNK pixels) with a remainder at every depth
+        payload = os.urandom(engine.CHUNK_BYTES * 2 + 1001)
+        for depth in engine.DEPTHS:
+            with self.subTest(depth=depth):
+                self.assertEqual(self.round_trip(carrier(700, 600), payload, depth=depth), payload)
+
+    def test_feistel_chunk_by_chunk(self):
+        # the positions of the feistel mode are computed for one chunk at a time
+        payload = os.urandom(engine.CHUNK_BYTES * 2 + 1001)
+        number = engine.byte_pixels(engine.HEADER.size + len(payload))
+        prng = engine.positions(engine.FEISTEL, 7, 700, 600, number)
+        full = np.asarray(prng)
+        self.assertEqual(len(np.unique(full)), number)
+        self.assertEqual(prng[engine.CHUNK:engine.CHUNK + 500].tolist(), full[engine.CHUNK:engine.CHUNK + 500].tolist())
+        counts = []
+
+        def generate(first, count):
+            counts.append(count)
+            return prng[first:first + count]
+
+        filled = engine.embed_pixels(carrier(700, 600), engine.LazyPositions(generate, number),
+                                     engine.payload_chunks(payload)[1])
+        self.assertEqual(engine.extract_pixels(filled, engine.LazyPositions(generate, number)), payload)
+        self.assertEqual(sum(counts), 2 * number)
+        self.assertLessEqual(max(counts), engine.CHUNK)
+
+    def test_compressed(self):
+        payload = b'A compressible message. ' * 2000 + os.urandom(100)
+        for codec in engine.CODECS:
+            for depth in (1, 3):
+                with self.subTest(codec=codec, depth=depth):
+                    self.assertEqual(self.round_trip(carrier(120, 90), payload, codec=codec, level=9, depth=depth), payload)
+                    self.assertEqual(self.round_trip(carrier(120, 90), io.BytesIO(payload), codec=codec), payload)
+
+    def test_compressed_ratio(self):
+        timer = engine.metrics.StageTimer('embed')
+        engine.embed(carrier(120, 90), b'a' * 50000, codec='lzma', timer=timer)
+        self.assertEqual(timer.info['codec'], 'lzma')
+        self.assertGreater(timer.info['ratio'], 10)
+
+
+class FileTest(unittest.TestCase):
+    """
+    BMP files processed without decoding: band by band (stream) and through a memory map (mmap)
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_stream_and_mmap(self):
+        # an odd width: rows of the file are padded
+        image = carrier(101, 67, seed=3)
+        for top_down in (False, True):
+            write_bmp(self.path('c.bmp'), image, top_down)
+            self.assertEqual(np.array(Image.open(self.path('c.bmp'))).tolist(), np.array(image).tolist())
+            for depth in engine.DEPTHS:
+                with self.subTest(top_down=top_down, depth=depth):
+                    key = engine.embed_stream(self.path('c.bmp'), self.path('s.bmp'), MESSAGE, band_rows=16, depth=depth)
+                    self.assertEqual(engine.extract_stream(self.path('s.bmp'), key, band_rows=10), MESSAGE)
+                    self.assertEqual(engine.extract_mmap(self.path('s.bmp'), key), MESSAGE)
+                    # the same file decoded by PIL
+                    self.assertEqual(engine.extract(self.path('s.bmp'), key), MESSAGE)
+                    key = engine.embed_mmap(self.path('c.bmp'), self.path('m.bmp'), io.BytesIO(MESSAGE), depth=depth)
+                    self.assertEqual(engine.extract_mmap(self.path('m.bmp'), key), MESSAGE)
+                    self.assertEqual(engine.extract_stream(self.path('m.bmp'), key, band_rows=7), MESSAGE)
+                    self.assertEqual(engine.extract(self.path('m.bmp'), key), MESSAGE)
+
+    def test_feistel(self):
+        write_bmp(self.path('c.bmp'), carrier(101, 67, seed=4))
+        key = engine.embed_mmap(self.path('c.bmp'), self.path('m.bmp'), MESSAGE, engine.FEISTEL)
+        self.assertEqual(engine.extract_mmap(self.path('m.bmp'), key), MESSAGE)
+        self.assertEqual(engine.extract_stream(self.path('m.bmp'), key), MESSAGE)
+
+    def test_image_path_to_file_path(self):
+        # a container saved by the image path is read without decoding
+        filled, key = engine.embed(carrier(80, 60), MESSAGE, depth=3)
+        filled.save(self.path('f.bmp'))
+        self.assertEqual(engine.extract_mmap(self.path('f.bmp'), key), MESSAGE)
+        self.assertEqual(engine.extract_stream(self.path('f.bmp'), key), MESSAGE)
+
+    def test_compressed(self):
+        payload = b'A compressible message. ' * 2000
+        write_bmp(self.path('c.bmp'), carrier(100, 60), top_down=True)
+        for codec in engine.CODECS:
+            with self.subTest(codec=codec):
+                key = engine.embed_stream(self.path('c.bmp'), self.path('s.bmp'), payload, codec=codec, band_rows=8)
+                self.assertEqual(engine.extract_stream(self.path('s.bmp'), key), payload)
+                key = engine.embed_mmap(self.path('c.bmp'), self.path('m.bmp'), payload, codec=codec)
+                self.assertEqual(engine.extract_mmap(self.path('m.bmp'), key), payload)
+
+    def test_wrong_container(self):
+        write_bmp(self.path('c.bmp'), carrier(100, 60, seed=1))
+        key = engine.embed_mmap(self.path('c.bmp'), self.path('m.bmp'), MESSAGE)
+        with self.assertRaises(ValueError):
+            engine.extract_mmap(self.path('c.bmp'), key)
+        with self.assertRaises(ValueError):
+            engine.extract_stream(self.path('c.bmp'), key)
+
+    def test_rejected_carrier_leaves_no_file(self):
+        carrier(40, 30, 'RGBA').save(self.path('c.png'))
+        write_bmp(self.path('c.bmp'), carrier(40, 30))
+        with self.assertRaises(ValueError):
+            engine.embed_stream(self.path('c.png'), self.path('s.bmp'), MESSAGE)
+        with self.assertRaises(ValueError):
+            engine.embed_stream(self.path('c.bmp'), self.path('s.bmp'), MESSAGE * 10)
+        with self.assertRaises(ValueError):
+            engine.embed_mmap(self.path('c.bmp'), self.path('m.bmp'), MESSAGE * 10)
+        self.assertFalse(os.path.exists(self.path('s.bmp')))
+        self.assertFalse(os.path.exists(self.path('m.bmp')))
+
+
+if __name__ == '__main__':
+    unittest.main()